@@ -2,8 +2,12 @@ import os
 import argparse
 import sys
 import json
+from collections import deque
 from pathlib import Path
 from utils.cv_pdf_formatter import format_cv_to_pdf
+from utils.prompt_budget import fit_inputs
+from utils.match_parser import (MATCH_GENERATION_CONFIG, parse_match_result, parse_plain_match, parse_ranking_prefix,
+                                render_match)
 
 # ألوان وجرافيك طرفية (لو الطرفية تدعم)
 try:
@@ -14,6 +18,15 @@ except ImportError:
         def __getattr__(self, x): return ""
     Fore = Style = Dummy()
 
+# أقصى عدد طلبات متوازية لـ Gemini في المطابقة المتعددة
+DEFAULT_MAX_PARALLEL = 5
+# أقصى وقت (ثواني) لكل طلب في المطابقة المتعددة قبل ما يتسجل كفشل
+DEFAULT_REQUEST_DEADLINE = 120
+# أقصى توكنز إدخال لكل برومبت؛ أي زيادة بتتقص قبل الإرسال
+DEFAULT_MAX_INPUT_TOKENS = 200000
+# ميزانية توكنز الإدخال لكل طلب في وضع الفرز السريع (packed)
+DEFAULT_PACK_TOKEN_BUDGET = 30000
+
 def print_logo_job_matcher():
     art = r"""
      ██╗ ██████╗ ██████╗     ███╗   ███╗ █████╗ ████████╗ ██████╗██╗  ██╗███████╗██████╗ 
@@ -53,15 +66,41 @@ def main():
     parser = argparse.ArgumentParser(description="AI Assistant for CV and Job Tools")
     parser.add_argument("--cv_enhancer", action="store_true", help="Enhance and generate CV with options")
     parser.add_argument("--job_matcher", action="store_true", help="Match CV with a job description (single or multiple jobs, with score & missing skills)")
+    parser.add_argument("--max_parallel", type=int, default=DEFAULT_MAX_PARALLEL, help="Max number of job descriptions sent to Gemini at the same time")
+    parser.add_argument("--record", metavar="CASSETTE", help="Record all Gemini traffic of this session to a cassette file")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Serve Gemini responses from a recorded cassette file")
+    parser.add_argument("--replay_latency", type=float, default=0.0, help="Replay with recorded latency × this factor (0 = instant)")
+    parser.add_argument("--max_input_tokens", type=int, default=DEFAULT_MAX_INPUT_TOKENS, help="Trim CV/job/instruction inputs so each prompt stays under this many tokens")
+    parser.add_argument("--token_budget", type=int, help="Stop sending new Gemini requests after this many tokens in the session")
+    parser.add_argument("--cost_budget", type=float, help="Stop sending new Gemini requests after this estimated cost (USD)")
+    parser.add_argument("--candidates", type=int, default=1, help="CV enhancer: ask for this many alternatives per call so Regenerate is instant (1–8)")
+    parser.add_argument("--route_target", choices=["fast", "balanced", "quality"], help="Model routing target: fast/cheap models or higher quality ones")
     args = parser.parse_args()
 
+    if args.route_target:
+        from utils.gemini_api import get_client
+        get_client().router.target = args.route_target
+
+    if args.token_budget or args.cost_budget:
+        from utils.gemini_api import get_client
+        meter = get_client().meter
+        meter.max_tokens = args.token_budget
+        meter.max_cost = args.cost_budget
+
+    if args.record or args.replay:
+        from utils.gemini_api import use_cassette
+        if args.replay:
+            use_cassette(args.replay, "replay", args.replay_latency)
+        else:
+            use_cassette(args.record, "record")
+
     if args.cv_enhancer:
         while True:
-            enhance_cv()
+            enhance_cv(max_input_tokens=args.max_input_tokens, candidates=args.candidates)
 
     elif args.job_matcher:
         while True:
-            job_matcher_multi_jobs()
+            job_matcher_multi_jobs(max_parallel=args.max_parallel, max_input_tokens=args.max_input_tokens)
 
     else:
         print_banner("AI CV Assistant")
@@ -80,24 +119,205 @@ def ascii_bar(score, outof=100, width=20):
     filled = int(round(score / outof * width))
     return Fore.YELLOW + "[" + Fore.GREEN + "█" * filled + Fore.RED + "-" * (width - filled) + Fore.YELLOW + f"] {score:.0f}/{outof}" + Style.RESET_ALL
 
-# استخراج النسبة والمهارات
+# استخراج النسبة والمهارات (ردود النص العادي)
 def extract_score_and_missing_skills(text):
-    import re
-    score = None
-    match = re.search(r"(\d{1,3})\s*/\s*100", text)
-    if match:
-        score = int(match.group(1))
-    else:
-        match = re.search(r"(\d{1,3})\s*%", text)
-        if match:
-            score = int(match.group(1))
-    missing_skills = []
-    ms_match = re.search(r"(Missing Skills|Areas for Improvement|To reach [\d]+/100.*?:|To increase your score.*?:)(.*?)(\n\n|\Z)", text, re.IGNORECASE | re.DOTALL)
-    if ms_match:
-        ms_block = ms_match.group(2)
-        ms_lines = [line.strip("-*• \t") for line in ms_block.strip().splitlines() if line.strip("-*• \t")]
-        missing_skills = [line for line in ms_lines if len(line) > 2]
-    return score, missing_skills
+    return parse_plain_match(text)
+
+# برومبت المطابقة (أو التقييم العام لو مفيش وصف وظيفة)
+# بيرجع (prefix, prompt): الـ prefix ثابت لكل الوظايف فبيترفع مرة واحدة في context cache
+def build_job_match_prompt(cv_content, job_desc, instruction_text):
+    if job_desc is None:
+        return None, f"""
+This is a general CV assessment request.
+CV:
+---
+{cv_content}
+---
+Additional Instructions:
+{instruction_text}
+---
+Please provide a detailed, constructive assessment of this CV, including strengths, weaknesses, and recommendations.
+Also, estimate a match score for a generic SOC Analyst role out of 100, and list missing skills/certifications for reaching 90/100.
+Show the score on a single line as 'Match Score: X/100'. List missing skills as bullet points.
+"""
+    prefix = f"""
+This is a user's CV/job matching request.
+CV:
+---
+{cv_content}
+---
+Additional Instructions:
+{instruction_text}
+---
+Compare the CV and the job description that follows. Highlight strengths, weaknesses, and give actionable recommendations to improve the CV for this job.
+Estimate a match score out of 100, and show it as 'Match Score: X/100' on a single line at the top.
+List missing skills/certifications needed to reach a score of 90/100 as bullet points, under a heading 'Missing Skills to reach 90/100:'.
+"""
+    return prefix, f"""
+Job Description:
+---
+{job_desc}
+---
+"""
+
+# إرسال كل البرومبتات مع بعض مع سطر تقدم حي
+def run_prompts_with_progress(prompts, max_parallel=DEFAULT_MAX_PARALLEL, prefix=None, generation_config=None,
+                              task=None, ask=None, on_result=None):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from utils.gemini_api import ask_gemini, get_client
+    ask = ask or ask_gemini
+
+    def progress():
+        limit = get_client().metrics()["concurrency_limit"]
+        print(f"\r⏳ Completed {done}/{len(prompts)} (in-flight limit: {limit})  ", end="", flush=True)
+
+    answers = [None] * len(prompts)
+    done = 0
+    progress()
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as pool:
+        # طلبات الدفعة بأولوية batch عشان أي طلب تفاعلي يعدي قبلها
+        futures = {pool.submit(ask, prompt, prefix=prefix, generation_config=generation_config,
+                               deadline=DEFAULT_REQUEST_DEADLINE, task=task, priority="batch"): idx
+                   for idx, prompt in enumerate(prompts)}
+        for future in as_completed(futures):
+            answers[futures[future]] = future.result()
+            if on_result:
+                on_result(futures[future], answers[futures[future]])
+            done += 1
+            progress()
+    print()
+    return answers
+
+# وضع الترتيب فقط: بنقرا الـ stream لحد ما الـ score والمهارات يكملوا وبعدين بنقفله
+# (نفس توقيع ask_gemini عشان يشتغل مع run_prompts_with_progress)
+def ask_ranking_only(prompt, prefix=None, generation_config=MATCH_GENERATION_CONFIG, deadline=None, task=None,
+                     priority="interactive"):
+    from utils.gemini_api import ask_gemini_stream
+    from utils.response_cache import StaleResponse
+    chunks = ask_gemini_stream(prompt, prefix=prefix, generation_config=generation_config, task=task,
+                               priority=priority)
+    text = ""
+    stale = None
+    try:
+        for chunk in chunks:
+            text += chunk
+            # الرد القديم (stale) لازم يفضل معلّم بعد ما نعيد صياغته، عشان التحذير والـ work queue
+            if getattr(chunk, "stale", False):
+                stale = chunk
+            ranking = parse_ranking_prefix(text)
+            if ranking:
+                score, missing_skills = ranking
+                text = render_match({"score": score, "missing_skills": missing_skills,
+                                     "strengths": [], "weaknesses": [], "analysis": ""})
+                break
+    finally:
+        chunks.close()
+    return StaleResponse(text, stale.cached_at) if stale is not None else text
+
+# دفعة محفوظة على الديسك: كل رد بيتسجل أول ما يوصل، ولو البرنامج وقع بنكمل الباقي بس
+def run_durable_batch(mode, prompts, labels, prefix, task, max_parallel=DEFAULT_MAX_PARALLEL, run_id=None):
+    from utils.work_queue import WorkQueue
+    queue = WorkQueue()
+    if run_id is None:
+        run_id = queue.open_run(mode, prefix, prompts, labels, MATCH_GENERATION_CONFIG, task)
+    answers = queue.load_run(run_id)["results"]
+    pending = [idx for idx, answer in enumerate(answers) if answer is None]
+    if len(pending) < len(prompts):
+        print(Fore.LIGHTBLUE_EX + f"♻️ Resuming saved run: {len(prompts) - len(pending)}/{len(prompts)} already done, "
+              f"sending the remaining {len(pending)}." + Style.RESET_ALL)
+
+    def save(i, answer):
+        idx = pending[i]
+        answers[idx] = answer
+        # الفشل والردود القديمة (stale) بيفضلوا pending عشان يتبعتوا تاني
+        if not answer.startswith("❌") and not getattr(answer, "stale", False):
+            queue.complete(run_id, idx, answer)
+
+    run_prompts_with_progress([prompts[idx] for idx in pending], max_parallel, prefix=prefix,
+                              generation_config=MATCH_GENERATION_CONFIG, task=task,
+                              ask=ask_ranking_only if mode == "ranking" else None, on_result=save)
+    # الـ run بتتقفل بس لو مفيش ولا رد pending (فشل أو stale)، وإلا تفضل في unfinished() عشان تتكمل
+    queue.finish(run_id)
+    return answers
+
+# لو فيه دفعة ما خلصتش من تشغيل قبل كده (البرنامج وقع أو الجهاز نام) نعرض نكملها
+def resume_unfinished_runs(max_parallel=DEFAULT_MAX_PARALLEL):
+    from utils.work_queue import WorkQueue
+    queue = WorkQueue()
+    for run_id, label, done, total in queue.unfinished():
+        print_choice_bar()
+        print(Fore.YELLOW + f"🔁 Unfinished batch found: {label} ({done}/{total} done)" + Style.RESET_ALL)
+        choice = input(Fore.CYAN + "Resume it? (y = resume, d = discard, Enter = skip): " + Style.RESET_ALL).strip().lower()
+        if choice == "d":
+            queue.discard(run_id)
+            continue
+        if choice != "y":
+            continue
+        run = queue.load_run(run_id)
+        answers = run_durable_batch(run["mode"], run["prompts"], run["labels"], run["prefix"], run["task"],
+                                    max_parallel, run_id)
+        results = collect_match_results(answers, run["labels"])
+
+        def fetch_full(idx):
+            from utils.gemini_api import ask_gemini
+            return ask_gemini(run["prompts"][idx], prefix=run["prefix"], generation_config=MATCH_GENERATION_CONFIG,
+                              deadline=DEFAULT_REQUEST_DEADLINE, task=run["task"])
+
+        show_match_results(results, ranking=run["mode"] == "ranking", fetch_full=fetch_full)
+
+# وضع الفرز السريع: كذا وصف وظيفة في طلب واحد والرد JSON
+def run_packed_matching(cv_content, instruction_text, job_descs, max_parallel=DEFAULT_MAX_PARALLEL,
+                        token_budget=DEFAULT_PACK_TOKEN_BUDGET):
+    from utils.job_packing import (PACKED_GENERATION_CONFIG, estimate_tokens, plan_packs, build_packed_prefix,
+                                   build_packed_prompt, parse_packed_reply, format_packed_answer)
+    prefix = build_packed_prefix(cv_content, instruction_text)
+    packs = plan_packs(job_descs, token_budget, estimate_tokens(prefix))
+    print(Fore.LIGHTBLUE_EX + f"📦 Packed {len(job_descs)} jobs into {len(packs)} request(s)." + Style.RESET_ALL)
+    prompts = [build_packed_prompt([(idx, job_descs[idx]) for idx in pack]) for pack in packs]
+    replies = run_prompts_with_progress(prompts, max_parallel, prefix=prefix, generation_config=PACKED_GENERATION_CONFIG,
+                                        task="match_score")
+
+    answers = [None] * len(job_descs)
+    requeue = []
+    for pack, reply in zip(packs, replies):
+        parsed, missing = parse_packed_reply(reply, pack)
+        for idx, (score, missing_skills) in parsed.items():
+            answers[idx] = format_packed_answer(score, missing_skills)
+        requeue += missing
+
+    if requeue:
+        # أي وظيفة ما اترجعش ليها رد سليم بتتبعت لوحدها
+        print(Fore.YELLOW + f"🔁 {len(requeue)} job(s) missing from packed replies, sending them individually..." + Style.RESET_ALL)
+        built = [build_job_match_prompt(cv_content, job_descs[idx], instruction_text) for idx in requeue]
+        singles = run_prompts_with_progress([prompt for _, prompt in built], max_parallel, prefix=built[0][0],
+                                            generation_config=MATCH_GENERATION_CONFIG, task="match_score")
+        for idx, answer in zip(requeue, singles):
+            answers[idx] = answer
+    return answers
+
+# عرض اللي اتقص من المدخلات عشان نلتزم بحد التوكنز
+def print_trim_report(cuts, max_input_tokens):
+    if not cuts:
+        return
+    print(Fore.YELLOW + f"✂️ Inputs trimmed to fit {max_input_tokens:,} input tokens:" + Style.RESET_ALL)
+    for line in cuts:
+        print(Fore.YELLOW + f"   - {line}" + Style.RESET_ALL)
+
+# طباعة الرد وهو بيوصل (لحد limit حرف) ورجوع النص كامل
+def stream_to_terminal(chunks, limit=1500):
+    parts = []
+    shown = 0
+    for chunk in chunks:
+        if getattr(chunk, "stale", False):
+            print(Fore.YELLOW + "⚠️ Gemini is unavailable — showing the last cached answer (may be outdated).\n" + Style.RESET_ALL)
+        parts.append(chunk)
+        if shown < limit:
+            piece = chunk[:limit - shown]
+            print(piece, end="", flush=True)
+            shown += len(piece)
+    text = "".join(parts)
+    print("...\n" if len(text) > limit else "\n")
+    return text
 
 # مكان الحفظ الافتراضي
 def get_default_save_dir():
@@ -122,9 +342,171 @@ def save_user_save_dir(path):
     with open(settings_file, "w", encoding="utf-8") as f:
         json.dump({"save_dir": path}, f)
 
-def job_matcher_multi_jobs():
+# تحويل الردود لنتايج (score + مهارات) مع عدّ الطلبات اللي فشلت
+def collect_match_results(answers, labels):
+    results = []
+    failed = 0
+    for idx, result in enumerate(answers):
+        if result.startswith("❌"):
+            # فشل بعد كل المحاولات: مش هنحسبه 0 عشان ما يبوظش الترتيب
+            failed += 1
+            results.append({"label": labels[idx], "result": result, "score": None, "missing_skills": [],
+                            "index": idx})
+            continue
+        # رد قديم من الكاش لأن Gemini مش متاح دلوقتي
+        stale = getattr(result, "stale", False)
+        # رد JSON حسب الـ schema، ولو نص عادي بيتقري بالـ parser السريع
+        result, score, missing_skills = parse_match_result(result)
+        results.append({
+            "label": labels[idx],
+            "result": result,
+            "score": score if score is not None else 0,
+            "missing_skills": missing_skills,
+            "stale": stale,
+            "index": idx
+        })
+    if failed:
+        print(Fore.RED + f"⚠️ {failed} request(s) failed after retries; they are listed last without a score." + Style.RESET_ALL)
+    return results
+
+# عرض النتايج مترتبة وبعدين قايمة الحفظ
+# fetch_full(index) بيجيب التحليل الكامل في وضع الترتيب
+def show_match_results(results, streamed=False, ranking=False, fetch_full=None):
+    # ترتيب النتائج بالأعلى أولاً
+    results = sorted(results, key=lambda x: -1 if x["score"] is None else x["score"], reverse=True)
+
+    # عرض النتائج في شكل منظم
+    for i, res in enumerate(results):
+        print_divider()
+        print(Fore.LIGHTYELLOW_EX + (f"#{i + 1} " if ranking else "") + f"⭐ Result for: {res['label']}" + Style.RESET_ALL)
+        if res.get("stale"):
+            print(Fore.YELLOW + "⚠️ Gemini is unavailable — showing the last cached answer (may be outdated)." + Style.RESET_ALL)
+        print_choice_bar()
+        # جرافيك النتيجة
+        if res["score"] is not None:
+            print("📊 Match Score:", ascii_bar(res["score"], 100, 20))
+        else:
+            print("Match Score: N/A")
+        # المهارات المفقودة
+        if res["missing_skills"]:
+            print(Fore.LIGHTRED_EX + "🛠️ Missing Skills to reach 90/100:" + Style.RESET_ALL)
+            for skill in res["missing_skills"]:
+                print(Fore.RED + f"   - {skill}" + Style.RESET_ALL)
+        if not streamed and not ranking:
+            print_choice_bar()
+            print("📝 Full Analysis:\n")
+            print(res["result"][:1500] + ("...\n" if len(res["result"]) > 1500 else ""))
+        print_divider()
+
+    # وضع الترتيب: التحليل الكامل بيتجاب بس للوظايف اللي المستخدم يفتحها
+    while ranking and fetch_full and results:
+        pick = input(Fore.CYAN + f"🔎 Open full analysis for result # (1–{len(results)}), or press Enter to continue: " + Style.RESET_ALL).strip()
+        if not pick:
+            break
+        if not pick.isdigit() or not 1 <= int(pick) <= len(results):
+            print(Fore.RED + "❌ Invalid choice. Try again." + Style.RESET_ALL)
+            continue
+        res = results[int(pick) - 1]
+        if not res.get("full"):
+            print(Fore.LIGHTBLUE_EX + f"\n🔍 Fetching full analysis for {res['label']}...\n" + Style.RESET_ALL)
+            answer = fetch_full(res["index"])
+            if answer.startswith("❌"):
+                print(Fore.RED + answer + Style.RESET_ALL)
+                continue
+            res["result"], score, missing_skills = parse_match_result(answer)
+            res["full"] = True
+            # التحليل الكامل هو المرجع؛ لو درجته مختلفة عن الترتيب السريع بنقول
+            if score is not None:
+                if res["score"] is not None and score != res["score"]:
+                    print(Fore.YELLOW + f"ℹ️ The full analysis scores this job {score}/100 "
+                          f"(the quick ranking said {res['score']}/100)." + Style.RESET_ALL)
+                res["score"], res["missing_skills"] = score, missing_skills
+        print_divider()
+        print(Fore.LIGHTYELLOW_EX + f"📝 Full Analysis for: {res['label']}\n" + Style.RESET_ALL)
+        print(res["result"][:1500] + ("...\n" if len(res["result"]) > 1500 else ""))
+        print_divider()
+
+    # واجهة الحفظ الجديدة
+    while True:
+        save_dir = load_user_save_dir()
+        print(Fore.LIGHTMAGENTA_EX + "\n💾 How would you like to save the results?" + Style.RESET_ALL)
+        print("1. 💼 Choose location and filename manually")
+        print(f"2. 🖥️ Save all in Desktop ({get_default_save_dir()})")
+        print(f"3. 📂 Save all in preferred folder (currently: {save_dir})")
+        print("4. 🔙 Return to main menu")
+        print("5. ⚙️ Set/change preferred save folder")
+        print("6. ❌ Exit")
+        save_choice = input(Fore.CYAN + "Choose (1–6): " + Style.RESET_ALL).strip()
+        if save_choice == "1":
+            for i, res in enumerate(results):
+                label = res['label'].replace(' ', '_')
+                fmt = input(f"Result {i+1}/{len(results)} – Save as [1] TXT, [2] PDF? ").strip()
+                path = input("Enter full file path (or Enter for Desktop): ").strip()
+                if not path:
+                    path = os.path.join(get_default_save_dir(), f"jobmatch_{i+1}_{label}.{'txt' if fmt == '1' else 'pdf'}")
+                if fmt == "1":
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(res["result"])
+                    print(Fore.GREEN + f"✅ Saved to {path}" + Style.RESET_ALL)
+                elif fmt == "2":
+                    try:
+                        format_cv_to_pdf(res["result"], filename=path)
+                        print(Fore.GREEN + f"✅ Saved to {path}" + Style.RESET_ALL)
+                    except Exception as e:
+                        print(Fore.RED + f"❌ Error saving PDF {path}: {e}" + Style.RESET_ALL)
+                else:
+                    print(Fore.RED + "❌ Invalid format." + Style.RESET_ALL)
+            break
+        elif save_choice == "2":
+            for i, res in enumerate(results):
+                label = res['label'].replace(' ', '_')
+                txt_path = os.path.join(get_default_save_dir(), f"jobmatch_{i+1}_{label}.txt")
+                with open(txt_path, "w", encoding="utf-8") as f:
+                    f.write(res["result"])
+                print(Fore.GREEN + f"✅ Saved TXT to {txt_path}" + Style.RESET_ALL)
+                pdf_path = os.path.join(get_default_save_dir(), f"jobmatch_{i+1}_{label}.pdf")
+                try:
+                    format_cv_to_pdf(res["result"], filename=pdf_path)
+                    print(Fore.GREEN + f"✅ Saved PDF to {pdf_path}" + Style.RESET_ALL)
+                except Exception as e:
+                    print(Fore.RED + f"❌ Error saving PDF {pdf_path}: {e}" + Style.RESET_ALL)
+            break
+        elif save_choice == "3":
+            for i, res in enumerate(results):
+                label = res['label'].replace(' ', '_')
+                txt_path = os.path.join(save_dir, f"jobmatch_{i+1}_{label}.txt")
+                with open(txt_path, "w", encoding="utf-8") as f:
+                    f.write(res["result"])
+                print(Fore.GREEN + f"✅ Saved TXT to {txt_path}" + Style.RESET_ALL)
+                pdf_path = os.path.join(save_dir, f"jobmatch_{i+1}_{label}.pdf")
+                try:
+                    format_cv_to_pdf(res["result"], filename=pdf_path)
+                    print(Fore.GREEN + f"✅ Saved PDF to {pdf_path}" + Style.RESET_ALL)
+                except Exception as e:
+                    print(Fore.RED + f"❌ Error saving PDF {pdf_path}: {e}" + Style.RESET_ALL)
+            break
+        elif save_choice == "4":
+            break
+        elif save_choice == "5":
+            new_dir = input("Enter full path to preferred save folder: ").strip()
+            if os.path.isdir(new_dir):
+                save_user_save_dir(new_dir)
+                print(Fore.GREEN + "Changed preferred folder successfully." + Style.RESET_ALL)
+            else:
+                print(Fore.RED + "❌ Invalid directory. Try again." + Style.RESET_ALL)
+        elif save_choice == "6":
+            print(Fore.YELLOW + "👋 Done. Exiting." + Style.RESET_ALL)
+            exit()
+        else:
+            print(Fore.RED + "❌ Invalid choice. Try again." + Style.RESET_ALL)
+
+def job_matcher_multi_jobs(max_parallel=DEFAULT_MAX_PARALLEL, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS):
+    # نفتح اتصالات Gemini في الخلفية والمستخدم لسه بيختار الملفات
+    from utils.gemini_api import warm_up
+    warm_up()
     print_logo_job_matcher()
     print(Fore.LIGHTCYAN_EX + "🚀 Welcome to the Job Matcher module! Let's help you shine! 🚀" + Style.RESET_ALL)
+    resume_unfinished_runs(max_parallel)
 
     # 1. طلب ملف CV
     while True:
@@ -158,6 +540,8 @@ def job_matcher_multi_jobs():
 
         job_descs = []
         job_desc_labels = []
+        packed = False
+        ranking = False
         if option == "1":
             print_choice_bar()
             print("How would you like to provide the job description?")
@@ -223,6 +607,15 @@ def job_matcher_multi_jobs():
                         with open(job_file, "r", encoding="utf-8") as f:
                             job_descs.append(f.read())
                     job_desc_labels.append(os.path.basename(job_file))
+            if len(job_descs) > 1:
+                print_choice_bar()
+                print("Matching mode:")
+                print("1. 🔬 Full analysis for each job")
+                print("2. ⚡ Quick screening (several jobs per request, score & missing skills only)")
+                print("3. 🏁 Ranking only (score & missing skills first, open full analysis on demand)")
+                mode = input(Fore.CYAN + "Choose (1–3): " + Style.RESET_ALL).strip()
+                packed = mode == "2"
+                ranking = mode == "3"
         elif option == "3":
             job_descs = [None]
             job_desc_labels = ["General CV Assessment"]
@@ -253,150 +646,50 @@ def job_matcher_multi_jobs():
         else:
             instruction_text = ""
 
-        from utils.gemini_api import ask_gemini
-        results = []
-        for idx, job_desc in enumerate(job_descs):
-            if job_desc is None:
-                prompt = f"""
-This is a general CV assessment request.
-CV:
----
-{cv_content}
----
-Additional Instructions:
-{instruction_text}
----
-Please provide a detailed, constructive assessment of this CV, including strengths, weaknesses, and recommendations.
-Also, estimate a match score for a generic SOC Analyst role out of 100, and list missing skills/certifications for reaching 90/100.
-Show the score on a single line as 'Match Score: X/100'. List missing skills as bullet points.
-"""
-            else:
-                prompt = f"""
-This is a user's CV/job matching request.
-CV:
----
-{cv_content}
----
-Job Description:
----
-{job_desc}
----
-Additional Instructions:
-{instruction_text}
----
-Compare the CV and the job description. Highlight strengths, weaknesses, and give actionable recommendations to improve the CV for this job.
-Estimate a match score out of 100, and show it as 'Match Score: X/100' on a single line at the top.
-List missing skills/certifications needed to reach a score of 90/100 as bullet points, under a heading 'Missing Skills to reach 90/100:'.
-"""
-            print_choice_bar()
-            print(Fore.LIGHTBLUE_EX + f"\n🔍 Sending content to Gemini for {job_desc_labels[idx]}...\n" + Style.RESET_ALL)
-            result = ask_gemini(prompt)
-            score, missing_skills = extract_score_and_missing_skills(result)
-            results.append({
-                "label": job_desc_labels[idx],
-                "result": result,
-                "score": score if score is not None else 0,
-                "missing_skills": missing_skills
-            })
-
-        # ترتيب النتائج بالأعلى أولاً
-        results = sorted(results, key=lambda x: x["score"], reverse=True)
-
-        # عرض النتائج في شكل منظم
-        for i, res in enumerate(results):
+        # نقص المدخلات لو البرومبت هيعدي حد التوكنز (التعليمات الأول، بعدين boilerplate الوظايف)
+        cv_text, instruction_text, job_descs, cuts = fit_inputs(cv_content, instruction_text, job_descs, max_input_tokens)
+        print_trim_report(cuts, max_input_tokens)
+        built = [build_job_match_prompt(cv_text, job_desc, instruction_text) for job_desc in job_descs]
+        prefix = built[0][0] if built else None
+        prompts = [prompt for _, prompt in built]
+        print_choice_bar()
+        print(Fore.LIGHTBLUE_EX + f"\n🔍 Sending {len(prompts)} request(s) to Gemini (up to {max_parallel} at a time)...\n" + Style.RESET_ALL)
+        from utils.gemini_api import get_client
+        from utils.usage_meter import format_usage
+        get_client().meter.start_batch(", ".join(job_desc_labels))
+        streamed = len(prompts) == 1
+        # الفرز بالـ score بيروح للموديل السريع؛ التقييم العام (من غير وصف وظيفة) درجة أعلى
+        task = "match_score" if prefix else "assessment"
+        if packed:
+            answers = run_packed_matching(cv_text, instruction_text, job_descs, max_parallel)
+        elif streamed:
+            # طلب واحد: نعرض التحليل وهو بيتكتب
+            from utils.gemini_api import ask_gemini_stream
             print_divider()
-            print(Fore.LIGHTYELLOW_EX + f"⭐ Result for: {res['label']}" + Style.RESET_ALL)
-            print_choice_bar()
-            # جرافيك النتيجة
-            if res["score"] is not None:
-                print("📊 Match Score:", ascii_bar(res["score"], 100, 20))
-            else:
-                print("Match Score: N/A")
-            # المهارات المفقودة
-            if res["missing_skills"]:
-                print(Fore.LIGHTRED_EX + "🛠️ Missing Skills to reach 90/100:" + Style.RESET_ALL)
-                for skill in res["missing_skills"]:
-                    print(Fore.RED + f"   - {skill}" + Style.RESET_ALL)
+            print(Fore.LIGHTYELLOW_EX + f"⭐ Result for: {job_desc_labels[0]}" + Style.RESET_ALL)
             print_choice_bar()
             print("📝 Full Analysis:\n")
-            print(res["result"][:1500] + ("...\n" if len(res["result"]) > 1500 else ""))
-            print_divider()
+            answers = [stream_to_terminal(ask_gemini_stream((prefix or "") + prompts[0], task=task))]
+        else:
+            # كل رد بيتحفظ على الديسك أول ما يوصل، فلو البرنامج وقع ما بندفعش تاني على اللي خلص
+            answers = run_durable_batch("ranking" if ranking else "full", prompts, job_desc_labels, prefix, task,
+                                        max_parallel)
+        results = collect_match_results(answers, job_desc_labels)
 
-        # واجهة الحفظ الجديدة
-        while True:
-            save_dir = load_user_save_dir()
-            print(Fore.LIGHTMAGENTA_EX + "\n💾 How would you like to save the results?" + Style.RESET_ALL)
-            print("1. 💼 Choose location and filename manually")
-            print(f"2. 🖥️ Save all in Desktop ({get_default_save_dir()})")
-            print(f"3. 📂 Save all in preferred folder (currently: {save_dir})")
-            print("4. 🔙 Return to main menu")
-            print("5. ⚙️ Set/change preferred save folder")
-            print("6. ❌ Exit")
-            save_choice = input(Fore.CYAN + "Choose (1–6): " + Style.RESET_ALL).strip()
-            if save_choice == "1":
-                for i, res in enumerate(results):
-                    label = res['label'].replace(' ', '_')
-                    fmt = input(f"Result {i+1}/{len(results)} – Save as [1] TXT, [2] PDF? ").strip()
-                    path = input("Enter full file path (or Enter for Desktop): ").strip()
-                    if not path:
-                        path = os.path.join(get_default_save_dir(), f"jobmatch_{i+1}_{label}.{'txt' if fmt == '1' else 'pdf'}")
-                    if fmt == "1":
-                        with open(path, "w", encoding="utf-8") as f:
-                            f.write(res["result"])
-                        print(Fore.GREEN + f"✅ Saved to {path}" + Style.RESET_ALL)
-                    elif fmt == "2":
-                        try:
-                            format_cv_to_pdf(res["result"], filename=path)
-                            print(Fore.GREEN + f"✅ Saved to {path}" + Style.RESET_ALL)
-                        except Exception as e:
-                            print(Fore.RED + f"❌ Error saving PDF {path}: {e}" + Style.RESET_ALL)
-                    else:
-                        print(Fore.RED + "❌ Invalid format." + Style.RESET_ALL)
-                break
-            elif save_choice == "2":
-                for i, res in enumerate(results):
-                    label = res['label'].replace(' ', '_')
-                    txt_path = os.path.join(get_default_save_dir(), f"jobmatch_{i+1}_{label}.txt")
-                    with open(txt_path, "w", encoding="utf-8") as f:
-                        f.write(res["result"])
-                    print(Fore.GREEN + f"✅ Saved TXT to {txt_path}" + Style.RESET_ALL)
-                    pdf_path = os.path.join(get_default_save_dir(), f"jobmatch_{i+1}_{label}.pdf")
-                    try:
-                        format_cv_to_pdf(res["result"], filename=pdf_path)
-                        print(Fore.GREEN + f"✅ Saved PDF to {pdf_path}" + Style.RESET_ALL)
-                    except Exception as e:
-                        print(Fore.RED + f"❌ Error saving PDF {pdf_path}: {e}" + Style.RESET_ALL)
-                break
-            elif save_choice == "3":
-                for i, res in enumerate(results):
-                    label = res['label'].replace(' ', '_')
-                    txt_path = os.path.join(save_dir, f"jobmatch_{i+1}_{label}.txt")
-                    with open(txt_path, "w", encoding="utf-8") as f:
-                        f.write(res["result"])
-                    print(Fore.GREEN + f"✅ Saved TXT to {txt_path}" + Style.RESET_ALL)
-                    pdf_path = os.path.join(save_dir, f"jobmatch_{i+1}_{label}.pdf")
-                    try:
-                        format_cv_to_pdf(res["result"], filename=pdf_path)
-                        print(Fore.GREEN + f"✅ Saved PDF to {pdf_path}" + Style.RESET_ALL)
-                    except Exception as e:
-                        print(Fore.RED + f"❌ Error saving PDF {pdf_path}: {e}" + Style.RESET_ALL)
-                break
-            elif save_choice == "4":
-                break
-            elif save_choice == "5":
-                new_dir = input("Enter full path to preferred save folder: ").strip()
-                if os.path.isdir(new_dir):
-                    save_user_save_dir(new_dir)
-                    print(Fore.GREEN + "Changed preferred folder successfully." + Style.RESET_ALL)
-                else:
-                    print(Fore.RED + "❌ Invalid directory. Try again." + Style.RESET_ALL)
-            elif save_choice == "6":
-                print(Fore.YELLOW + "👋 Done. Exiting." + Style.RESET_ALL)
-                exit()
-            else:
-                print(Fore.RED + "❌ Invalid choice. Try again." + Style.RESET_ALL)
+        usage = get_client().meter.totals()
+        print(Fore.LIGHTBLACK_EX + f"🔢 This batch: {format_usage(usage['batch'])}" + Style.RESET_ALL)
+        print(Fore.LIGHTBLACK_EX + f"🔢 Session:    {format_usage(usage['session'])}" + Style.RESET_ALL)
 
-def enhance_cv():
+        def fetch_full(idx):
+            from utils.gemini_api import ask_gemini
+            return ask_gemini(prompts[idx], prefix=prefix, generation_config=MATCH_GENERATION_CONFIG,
+                              deadline=DEFAULT_REQUEST_DEADLINE, task=task)
+
+        show_match_results(results, streamed=streamed, ranking=ranking, fetch_full=fetch_full)
+
+def enhance_cv(max_input_tokens=DEFAULT_MAX_INPUT_TOKENS, candidates=1):
+    from utils.gemini_api import warm_up
+    warm_up()
     print_logo_cv_enhancer()
     print(Fore.LIGHTYELLOW_EX + "🌟 Welcome to the CV Enhancer! Let's build your best version! 🌟" + Style.RESET_ALL)
 
@@ -459,14 +752,24 @@ def enhance_cv():
         else:
             instruction_text = ""
 
-        from utils.gemini_api import ask_gemini
+        from utils.gemini_api import ask_gemini_stream, ask_gemini_candidates
+        cv_text, instruction_text, _, cuts = fit_inputs(cv_content, instruction_text, [], max_input_tokens)
+        print_trim_report(cuts, max_input_tokens)
 
-        def generate_output():
+        # البدائل اللي جت مع آخر طلب ولسه ما اتعرضتش (candidateCount)
+        pending = deque()
+
+        def generate_output(use_cache=True):
+            task = choice_map[choice].replace(" ", "_")
+            if pending:
+                print_divider()
+                print(Fore.LIGHTYELLOW_EX + f"📄 Preview of result (alternative, {len(pending) - 1} more ready):" + Style.RESET_ALL)
+                return stream_to_terminal([pending.popleft()])
             prompt = f"""
 This is a user's {choice_map[choice]} request.
 CV:
 ---
-{cv_content}
+{cv_text}
 ---
 Additional Instructions:
 {instruction_text}
@@ -475,14 +778,25 @@ Please write the best possible {choice_map[choice]} based on the above.
 """
             print_choice_bar()
             print(Fore.LIGHTBLUE_EX + "\n🔍 Sending content to Gemini...\n" + Style.RESET_ALL)
-            return ask_gemini(prompt)
+            print_divider()
+            print(Fore.LIGHTYELLOW_EX + "📄 Preview of result:" + Style.RESET_ALL)
+            if candidates > 1:
+                # طلب واحد بكذا بديل: Regenerate بعد كده بيعرض اللي بعده فوراً
+                texts = ask_gemini_candidates(prompt, candidates, task=task)
+                pending.extend(texts[1:])
+                return stream_to_terminal(texts[:1])
+            # المستند النهائي بيروح لموديل أعلى جودة (ModelRouter)
+            return stream_to_terminal(ask_gemini_stream(prompt, use_cache=use_cache, task=task))
 
         result = generate_output()
+        preview_shown = True
 
         while True:
-            print_divider()
-            print(Fore.LIGHTYELLOW_EX + "📄 Preview of result:" + Style.RESET_ALL)
-            print(result[:1500] + ("...\n" if len(result) > 1500 else ""))
+            if not preview_shown:
+                print_divider()
+                print(Fore.LIGHTYELLOW_EX + "📄 Preview of result:" + Style.RESET_ALL)
+                print(result[:1500] + ("...\n" if len(result) > 1500 else ""))
+            preview_shown = False
 
             confirm = input(Fore.LIGHTGREEN_EX + "\n🧾 Is this output ready for final formatting? (y/n): " + Style.RESET_ALL).lower()
             if confirm == "y":
@@ -520,7 +834,9 @@ Please write the best possible {choice_map[choice]} based on the above.
                 else:
                     print(Fore.RED + "❌ File not found. Keeping previous result." + Style.RESET_ALL)
             elif correction == "3":
-                result = generate_output()
+                # Regenerate لازم يروح لـ Gemini فعلاً مش للكاش
+                result = generate_output(use_cache=False)
+                preview_shown = True
             elif correction == "4":
                 print(Fore.YELLOW + "↩️ Returning to main menu..." + Style.RESET_ALL)
                 return
@@ -0,0 +1,99 @@
+"""Benchmark request-body compression and the JSON codec against the local stand-in.
+
+    python -m utils.bench_payload --size-kb 400 --bandwidth 1000000 --runs 5
+    python -m utils.bench_payload --prompt-file job_pack.txt
+
+--bandwidth simulates the upload link in bytes/second (e.g. 1000000 ≈ 8 Mbit/s).
+"""
+import gzip
+import time
+import random
+import argparse
+import statistics
+from utils import json_codec
+from utils.fake_gemini_server import start_fake_server
+from utils.gemini_api import GeminiClient
+from utils.llm_providers import GeminiProvider
+from utils.rate_limit import RetryPolicy
+
+_WORDS = ("experience requirements responsibilities security analyst incident response network monitoring "
+          "cloud python siem threat detection team project certification strong role benefits salary "
+          "we are looking for years of knowledge ability communication written verbal").split()
+
+
+def synthetic_prompt(size_kb, seed=1):
+    rnd = random.Random(seed)
+    lines = []
+    size = 0
+    while size < size_kb * 1024:
+        line = " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(6, 18))).capitalize() + "."
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def _median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def bench_codec(payload, runs):
+    results = {}
+    for codec in ("json", "orjson"):
+        if json_codec.use(codec) != codec:
+            continue  # orjson مش متسطب
+        body = json_codec.dumps(payload)
+        results[codec] = (_median_ms(lambda: json_codec.dumps(payload), runs),
+                          _median_ms(lambda: json_codec.loads(body), runs))
+    json_codec.use("orjson")
+    return results
+
+
+def bench_upload(prompt, url, runs, compress_min_bytes):
+    client = GeminiClient(provider=GeminiProvider("bench", url), compress_min_bytes=compress_min_bytes,
+                          retry_policy=RetryPolicy(max_attempts=1))
+    try:
+        # الطلب الأول بيفتح الاتصال، مش بيتحسب
+        client.generate(prompt, use_cache=False)
+        return _median_ms(lambda: client.generate(prompt, use_cache=False), runs)
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gzip request bodies and the JSON codec")
+    parser.add_argument("--size-kb", type=int, default=400, help="Size of the synthetic prompt")
+    parser.add_argument("--prompt-file", help="Use this text file as the prompt instead")
+    parser.add_argument("--bandwidth", type=float, default=1_000_000, help="Simulated upload bytes/second")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.prompt_file:
+        with open(args.prompt_file, "r", encoding="utf-8") as f:
+            prompt = f.read()
+    else:
+        prompt = synthetic_prompt(args.size_kb)
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    raw = json_codec.dumps(payload)
+    print(f"Prompt: {len(raw) / 1024:,.0f} KiB JSON body")
+
+    print("\nJSON codec (median ms)        encode   decode")
+    for codec, (encode_ms, decode_ms) in bench_codec(payload, args.runs * 4).items():
+        print(f"  {codec:<27}{encode_ms:>7.2f}  {decode_ms:>7.2f}")
+
+    server, url = start_fake_server(upload_bandwidth=args.bandwidth, output_tokens=50)
+    print(f"\nRound trip via fake server at {args.bandwidth / 1e6:g} MB/s upload (median ms)")
+    plain_ms = bench_upload(prompt, url, args.runs, None)
+    gzip_ms = bench_upload(prompt, url, args.runs, 1)
+    ratio = len(raw) / len(gzip.compress(raw, 6))
+    print(f"  plain                      {plain_ms:>8.1f}")
+    print(f"  gzip (×{ratio:.1f} smaller)         {gzip_ms:>8.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Check that interactive calls overtake queued batch work with the shared client's setup.
+
+    python -m utils.bench_priority --slots 2 --batch 30 --latency 0.3
+
+Builds the client the app uses (hedging, breaker, router, meter, ...) against
+the local stand-in, queues --batch batch calls, then times one interactive
+call with hedging on and off. Exits 1 if hedging makes the interactive call
+wait behind the batch work.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from utils.fake_gemini_server import start_fake_server
+from utils.gemini_api import build_client
+from utils.rate_limit import AdaptiveConcurrency, BATCH
+
+
+def interactive_latency(url, slots, batch, latency, hedging):
+    client = build_client("bench", url)
+    # الـ limit ثابت عشان النتيجة ما تتأثرش بالـ AIMD
+    client.concurrency = AdaptiveConcurrency(initial=slots, min_limit=slots, max_limit=slots)
+    if not hedging:
+        client.hedger = None
+    threads = [threading.Thread(target=client.generate, args=(f"batch prompt {i}",),
+                                kwargs={"use_cache": False, "priority": BATCH}) for i in range(batch)]
+    for thread in threads:
+        thread.start()
+    # نستنى لحد ما الـ batch يملا الطابور
+    time.sleep(latency)
+    started = time.perf_counter()
+    client.generate("interactive prompt", use_cache=False)
+    elapsed = time.perf_counter() - started
+    for thread in threads:
+        thread.join()
+    client.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check priority dispatch with the shared client configuration")
+    parser.add_argument("--slots", type=int, default=2)
+    parser.add_argument("--batch", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake server latency in seconds")
+    args = parser.parse_args()
+
+    # من غير كاش على الديسك، وبنفس إعدادات get_client غير كده
+    os.environ["GEMINI_CACHE"] = "0"
+    server, url = start_fake_server(latency=f"fixed:{args.latency}", output_tokens=50)
+    plain = interactive_latency(url, args.slots, args.batch, args.latency, hedging=False)
+    hedged = interactive_latency(url, args.slots, args.batch, args.latency, hedging=True)
+    server.shutdown()
+
+    backlog = args.batch * args.latency / args.slots
+    print(f"Interactive call behind {args.batch} batch calls ({args.slots} slots, backlog ≈ {backlog:.1f}s)")
+    print(f"  hedging off                {plain:>6.2f}s")
+    print(f"  hedging on                 {hedged:>6.2f}s")
+    # الـ hedging ما يزودش أكتر من طلبين تقريباً على الانتظار
+    if hedged > plain + 2 * args.latency:
+        print("❌ Interactive call waited behind batch work with hedging on.")
+        sys.exit(1)
+    print("✅ Interactive calls keep their priority with hedging on.")
+
+
+if __name__ == "__main__":
+    main()
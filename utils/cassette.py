@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+
+class Cassette:
+    """Record/replay store for Gemini traffic.
+
+    One SQLite file indexed by request key; each reply (or list of stream
+    chunks) is stored zlib-compressed with the latency it took. Repeated
+    identical requests are kept in order and replayed in the same order.
+    mode is "record" or "replay"; latency_scale=1.0 replays with the
+    recorded latency, 0 serves instantly.
+    """
+
+    def __init__(self, path, mode="replay", latency_scale=0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == "replay" and not os.path.exists(path):
+            raise FileNotFoundError(f"Cassette not found: {path}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.positions = {}
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS interactions (
+                key TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                latency REAL NOT NULL,
+                body BLOB NOT NULL,
+                PRIMARY KEY (key, seq)
+            )
+        """)
+        if mode == "record":
+            self.conn.execute("DELETE FROM interactions")
+        self.conn.commit()
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def record(self, key, kind, body, latency):
+        blob = zlib.compress(json.dumps(body, ensure_ascii=False).encode("utf-8"))
+        with self.lock:
+            seq = self.conn.execute("SELECT COUNT(*) FROM interactions WHERE key = ?", (key,)).fetchone()[0]
+            self.conn.execute("INSERT INTO interactions (key, seq, kind, latency, body) VALUES (?, ?, ?, ?, ?)",
+                              (key, seq, kind, latency, blob))
+            self.conn.commit()
+
+    def replay(self, key, kind):
+        """Return (body, latency) for the next recording of key, or None."""
+        with self.lock:
+            rows = self.conn.execute("SELECT latency, body FROM interactions WHERE key = ? AND kind = ? ORDER BY seq",
+                                     (key, kind)).fetchall()
+            if not rows:
+                return None
+            # لو الطلب اتكرر أكتر من اللي اتسجل بنلف على التسجيلات من الأول
+            position = self.positions.get((key, kind), 0)
+            self.positions[(key, kind)] = position + 1
+            latency, blob = rows[position % len(rows)]
+        return json.loads(zlib.decompress(blob).decode("utf-8")), latency
+
+    def wait(self, latency):
+        if self.latency_scale:
+            time.sleep(latency * self.latency_scale)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
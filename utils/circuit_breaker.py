@@ -0,0 +1,72 @@
+import time
+import threading
+from utils.llm_providers import GeminiError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(GeminiError):
+    pass
+
+
+def counts_as_outage(error):
+    # أخطاء الطلب نفسه (400، مفتاح غلط...) أو مش من الـ API أصلاً (رد مش JSON...) مش معناها إن Gemini واقع
+    if not isinstance(error, GeminiError):
+        return False
+    return error.status_code is None or error.status_code in (429, 500, 502, 503, 504)
+
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures.
+
+    Opens after failure_threshold consecutive outage errors. While open,
+    calls raise CircuitOpenError immediately; after reset_timeout one probe
+    is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+            wait = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(f"Gemini looks unavailable (circuit open, retrying in {wait:.0f}s).")
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self, error):
+        if not counts_as_outage(error):
+            # الـ probe خلص من غير ما يثبت حاجة، نسمح بـ probe تاني
+            with self.lock:
+                self.probing = False
+            return
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def metrics(self):
+        with self.lock:
+            return {"circuit_state": self.state, "consecutive_failures": self.failures}
@@ -0,0 +1,80 @@
+import time
+import hashlib
+import threading
+from utils.llm_providers import GeminiError
+from utils.prompt_budget import estimate_tokens
+
+
+def _prefix_key(model, prefix):
+    return hashlib.sha256(f"{model}\n{prefix}".encode("utf-8")).hexdigest()
+
+
+class ContextCacheManager:
+    """Upload a shared prompt prefix once as Gemini cached content.
+
+    Per-request payloads then reference the cachedContents handle and only
+    carry the varying suffix. Handles are refreshed shortly before their
+    TTL runs out and deleted by cleanup(). Prefixes the API refuses to cache
+    (too short, unsupported model) are remembered and sent inline.
+    """
+
+    def __init__(self, client, ttl=600, min_tokens=4096, refresh_margin=30):
+        self.client = client
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.refresh_margin = refresh_margin
+        self.handles = {}        # key -> (name, expires_at)
+        self.uncacheable = set()
+        self.lock = threading.Lock()
+
+    def _create(self, prefix, model):
+        body = {
+            "model": f"models/{model}",
+            "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+            "ttl": f"{int(self.ttl)}s",
+        }
+        try:
+            reply = self.client.post_json(self.client.provider.resource_url("cachedContents"), body, model=model)
+        except GeminiError as e:
+            if e.status_code == 400:
+                return None
+            raise
+        return reply.get("name")
+
+    def handle_for(self, prefix, model):
+        if estimate_tokens(prefix) < self.min_tokens:
+            return None
+        key = _prefix_key(model, prefix)
+        with self.lock:
+            if key in self.uncacheable:
+                return None
+            name, expires_at = self.handles.get(key, (None, 0))
+            if name and expires_at - time.time() > self.refresh_margin:
+                return name
+            name = self._create(prefix, model)
+            if name is None:
+                self.uncacheable.add(key)
+                return None
+            self.handles[key] = (name, time.time() + self.ttl)
+            return name
+
+    def payload_for(self, prefix, prompt, model):
+        name = self.handle_for(prefix, model)
+        if name is None:
+            return self.client.build_payload(prefix + prompt)
+        return {
+            "cachedContent": name,
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        }
+
+    def cleanup(self):
+        with self.lock:
+            handles, self.handles = self.handles, {}
+        for name, expires_at in handles.values():
+            if expires_at <= time.time():
+                continue
+            try:
+                self.client.delete(self.client.provider.resource_url(name))
+            except Exception:
+                # السيرفر هيمسحها لوحده لما الـ TTL يخلص
+                pass
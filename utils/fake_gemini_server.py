@@ -0,0 +1,259 @@
+"""Local stand-in for the Gemini REST API, for load tests and offline runs.
+
+Serves generateContent, streamGenerateContent (SSE) and cachedContents with
+configurable latency, error rate and output size. Point the client at it:
+
+    python -m utils.fake_gemini_server --port 8765 --latency lognormal:1.2,0.5 --error-rate 0.05
+    GEMINI_ENDPOINT=http://127.0.0.1:8765/v1beta GEMINI_API_KEY=fake python main.py --job_matcher
+"""
+import re
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+_WORDS = ("experience skills security analyst incident response network monitoring "
+          "cloud python siem threat detection team project certification strong role").split()
+
+
+class LatencyModel:
+    """fixed:S, uniform:A,B or lognormal:MEDIAN,SIGMA (seconds)."""
+
+    def __init__(self, spec="fixed:0"):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a] or [0.0]
+
+    def sample(self):
+        if self.kind == "uniform":
+            return random.uniform(self.args[0], self.args[1])
+        if self.kind == "lognormal":
+            median, sigma = self.args[0], self.args[1] if len(self.args) > 1 else 0.5
+            return random.lognormvariate(0, sigma) * median
+        return self.args[0]
+
+
+class FakeGeminiConfig:
+    def __init__(self, latency="fixed:0", error_rate=0.0, error_codes=(429, 503), retry_after=1,
+                 output_tokens=300, stream_chunks=8, seed=None, unavailable_models=(), upload_bandwidth=None,
+                 accept_gzip=True):
+        self.latency = LatencyModel(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.retry_after = retry_after
+        self.output_tokens = output_tokens
+        self.stream_chunks = stream_chunks
+        # موديلات بترجع 404 (لتجربة الـ fallback في ModelRouter)
+        self.unavailable_models = set(unavailable_models)
+        # bytes/ثانية: محاكاة لينك رفع بطيء (None = سرعة الـ loopback)
+        self.upload_bandwidth = upload_bandwidth
+        self.accept_gzip = accept_gzip
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "streams": 0, "cached_contents": 0, "pings": 0}
+        self.cached_contents = {}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def _prompt_text(payload, cached_contents):
+    texts = []
+    cached = cached_contents.get(payload.get("cachedContent"))
+    if cached:
+        texts.append(cached)
+    for content in payload.get("contents", []):
+        texts += [part.get("text", "") for part in content.get("parts", [])]
+    return "\n".join(texts)
+
+
+def _fake_from_schema(schema, prompt, rnd):
+    kind = schema.get("type", "STRING").upper()
+    if kind == "OBJECT":
+        return {name: _fake_from_schema(sub, prompt, rnd) if name != "score" else rnd.randint(40, 95)
+                for name, sub in schema.get("properties", {}).items()}
+    if kind == "ARRAY":
+        item = schema.get("items", {})
+        job_ids = [int(i) for i in re.findall(r"Job ID: (\d+)", prompt)]
+        if job_ids and "job_id" in item.get("properties", {}):
+            # وضع الـ packed: عنصر لكل وظيفة في البرومبت
+            return [dict(_fake_from_schema(item, "", rnd), job_id=job_id) for job_id in job_ids]
+        return [_fake_from_schema(item, prompt, rnd) for _ in range(rnd.randint(1, 4))]
+    if kind == "INTEGER":
+        return rnd.randint(0, 100)
+    return " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(3, 12)))
+
+
+def _fake_text(prompt, config, n_tokens, generation_config):
+    rnd = random.Random(hash(prompt) ^ config.random.randint(0, 1 << 30))
+    schema = generation_config.get("responseSchema")
+    if generation_config.get("responseMimeType") == "application/json" and schema:
+        return json.dumps(_fake_from_schema(schema, prompt, rnd))
+    words = [rnd.choice(_WORDS) for _ in range(max(1, n_tokens - 20))]
+    return (f"Match Score: {rnd.randint(40, 95)}/100\n\n"
+            f"Missing Skills to reach 90/100:\n- {rnd.choice(_WORDS)}\n- {rnd.choice(_WORDS)}\n\n"
+            + " ".join(words) + "\n")
+
+
+def _usage(prompt, text, cached_tokens=0):
+    usage = {
+        "promptTokenCount": _estimate_tokens(prompt),
+        "candidatesTokenCount": _estimate_tokens(text),
+    }
+    usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+    if cached_tokens:
+        usage["cachedContentTokenCount"] = cached_tokens
+    return usage
+
+
+def _reply(texts, usage):
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": t}]}, "finishReason": "STOP", "index": i}
+                       for i, t in enumerate(texts)],
+        "usageMetadata": usage,
+    }
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+            if config.upload_bandwidth:
+                time.sleep(len(raw) / config.upload_bandwidth)
+            if self.headers.get("Content-Encoding") == "gzip":
+                raw = gzip.decompress(raw)
+            return json.loads(raw or b"{}")
+
+        def _maybe_fail(self):
+            if config.error_rate and config.random.random() < config.error_rate:
+                config.count("errors")
+                code = config.random.choice(config.error_codes)
+                self._json(code, {"error": {"code": code, "message": "Simulated error", "status": "UNAVAILABLE"}},
+                           {"Retry-After": str(config.retry_after)} if code == 429 else None)
+                return True
+            return False
+
+        def do_HEAD(self):
+            # pre-warming من العميل: رد فاضي بس الاتصال بيفضل مفتوح
+            config.count("pings")
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_DELETE(self):
+            name = urlparse(self.path).path.split("/v1beta/", 1)[-1]
+            config.cached_contents.pop(name, None)
+            self._json(200, {})
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if self.headers.get("Content-Encoding") == "gzip" and not config.accept_gzip:
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                return self._json(415, {"error": {"code": 415, "message": "Unsupported Content-Encoding: gzip"}})
+            body = self._read_body()
+            config.count("requests")
+            if path.endswith("/cachedContents"):
+                config.count("cached_contents")
+                name = f"cachedContents/fake-{len(config.cached_contents) + 1}-{int(time.time())}"
+                config.cached_contents[name] = _prompt_text(body, {})
+                return self._json(200, {"name": name, "model": body.get("model")})
+            if not self.headers.get("X-Goog-Api-Key"):
+                return self._json(403, {"error": {"code": 403, "message": "API key missing"}})
+
+            model = path.rsplit("/models/", 1)[-1].split(":", 1)[0]
+            if model in config.unavailable_models:
+                return self._json(404, {"error": {"code": 404, "message": f"models/{model} is not found",
+                                                  "status": "NOT_FOUND"}})
+            time.sleep(config.latency.sample())
+            if self._maybe_fail():
+                return
+            generation_config = body.get("generationConfig") or {}
+            prompt = _prompt_text(body, config.cached_contents)
+            cached_tokens = _estimate_tokens(config.cached_contents.get(body.get("cachedContent"), "")) \
+                if body.get("cachedContent") in config.cached_contents else 0
+            n_tokens = min(config.output_tokens, generation_config.get("maxOutputTokens") or config.output_tokens)
+            candidates = max(1, int(generation_config.get("candidateCount") or 1))
+            texts = [_fake_text(prompt + str(i), config, n_tokens, generation_config) for i in range(candidates)]
+
+            if path.endswith(":streamGenerateContent"):
+                return self._stream(prompt, texts[0], cached_tokens)
+            usage = _usage(prompt, "".join(texts), cached_tokens)
+            return self._json(200, _reply(texts, usage))
+
+        def _stream(self, prompt, text, cached_tokens):
+            config.count("streams")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            step = max(1, len(text) // config.stream_chunks)
+            pieces = [text[i:i + step] for i in range(0, len(text), step)]
+            try:
+                for i, piece in enumerate(pieces):
+                    chunk = _reply([piece], _usage(prompt, text, cached_tokens) if i == len(pieces) - 1 else {})
+                    self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(config.latency.sample() / (4 * config.stream_chunks))
+            except (BrokenPipeError, ConnectionResetError):
+                # العميل قفل الـ stream بدري
+                pass
+
+    return Handler
+
+
+def start_fake_server(port=0, **config_kwargs):
+    """Start the stand-in in a daemon thread; returns (server, endpoint_url)."""
+    config = FakeGeminiConfig(**config_kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Gemini API server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:1.0,0.5", help="fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output-tokens", type=int, default=300)
+    parser.add_argument("--upload-bandwidth", type=float, help="Simulated upload speed in bytes/second")
+    args = parser.parse_args()
+    server, url = start_fake_server(args.port, latency=args.latency, error_rate=args.error_rate,
+                                    output_tokens=args.output_tokens, upload_bandwidth=args.upload_bandwidth)
+    print(f"🧪 Fake Gemini listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,683 @@
 import os
+import json
+import gzip
+import time
+import hashlib
+import atexit
+import asyncio
+import threading
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from utils.response_cache import ResponseCache, DEFAULT_CACHE_PATH
+from utils.single_flight import SingleFlight
+from utils.context_cache import ContextCacheManager
+from utils.cassette import Cassette
+from utils.hedging import HedgedCaller, remaining
+from utils.key_pool import KeyPool
+from utils.usage_meter import UsageMeter, BudgetExceededError
+from utils.model_router import ModelRouter, MODEL_LADDER, should_fallback
+from utils.prompt_budget import estimate_tokens
+from utils import json_codec
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, counts_as_outage
+from utils.llm_providers import GeminiError, GeminiProvider
+from utils.rate_limit import (RetryPolicy, ModelRateLimiter, AdaptiveConcurrency, parse_retry_after, parse_retry_delay,
+                              INTERACTIVE, BATCH)
 
 # ⬅️ تحميل متغيرات البيئة من ملف .env
 load_dotenv()
 
 API_KEY = os.getenv("GEMINI_API_KEY")
 
-def ask_gemini(prompt):
-    if not API_KEY:
-        return "❌ Error: API key not found."
-    
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Goog-Api-Key": API_KEY
-    }
-    data = {
-        "contents": [{"parts": [{"text": prompt}]}]
-    }
-
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
-        return response.json().get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "❌ No response.")
-    else:
-        return f"❌ API Error {response.status_code}: {response.text}"
+# GEMINI_ENDPOINT ممكن يشاور على السيرفر المحلي (utils/fake_gemini_server.py)
+DEFAULT_ENDPOINT = os.getenv("GEMINI_ENDPOINT", "https://generativelanguage.googleapis.com/v1beta")
+DEFAULT_MODEL = "gemini-1.5-flash"
+# أقصى candidateCount بيقبله Gemini في طلب واحد
+MAX_CANDIDATES = 8
+
+
+class GeminiClient:
+    """Reusable Gemini client backed by a pooled keep-alive HTTP session.
+
+    URLs, auth and reply parsing come from the provider (GeminiProvider by
+    default), so the same client can talk to another backend or a stand-in.
+    """
+
+    def __init__(self, api_key=None, model=DEFAULT_MODEL, endpoint=DEFAULT_ENDPOINT,
+                 pool_size=10, connect_timeout=5.0, read_timeout=120.0, cache=None,
+                 retry_policy=None, rpm_limits=None, concurrency=None, context_cache=None,
+                 provider=None, cassette=None, hedger=None, breaker=None, stale_fallback=False,
+                 meter=None, router=None, compress_min_bytes=None):
+        self.provider = provider or GeminiProvider(api_key if api_key is not None else API_KEY, endpoint)
+        self.model = model
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+        self.single_flight = SingleFlight()
+        self.retry_policy = retry_policy or RetryPolicy()
+        # rpm_limits = {"gemini-1.5-flash": 15, ...}
+        self.rate_limiter = ModelRateLimiter(rpm_limits)
+        # عدد الطلبات المفتوحة بيتظبط لوحده (AIMD)
+        self.concurrency = concurrency or AdaptiveConcurrency(initial=max(1, pool_size // 2), max_limit=pool_size)
+        # ContextCacheManager؛ None = البادئة بتتبعت مع كل طلب
+        self.context_cache = context_cache
+        # Cassette للتسجيل أو إعادة التشغيل (--record / --replay)
+        self.cassette = cassette
+        # HedgedCaller: طلب مكرر لو الأول اتأخر عن الـ p95
+        self.hedger = hedger
+        # CircuitBreaker: بيوقف الطلبات بسرعة لما Gemini يفشل كذا مرة ورا بعض
+        self.breaker = breaker
+        self.stale_fallback = stale_fallback
+        # UsageMeter: عداد التوكنز والميزانية
+        self.meter = meter
+        # ModelRouter: بيختار الموديل حسب نوع الطلب لما generate يتنادى بـ task
+        self.router = router
+        # الـ bodies الأكبر من كده بتتبعت gzip (None = من غير ضغط)
+        self.compress_min_bytes = compress_min_bytes
+
+        # pre-warming: اتصالات مفتوحة جاهزة قبل أول طلب (warm_up)
+        self.last_request_at = 0.0
+        self.warm_pings = 0
+        self._warmer = None
+        self._warm_stop = threading.Event()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _url(self, model, method):
+        return self.provider.url(model or self.model, method)
+
+    def _send(self, url, payload, headers, stream=False, deadline_at=None):
+        timeout = self.timeout
+        budget = remaining(deadline_at)
+        if budget is not None:
+            if budget <= 0:
+                raise GeminiError("Deadline exceeded.", timed_out=True)
+            timeout = (min(self.timeout[0], budget), min(self.timeout[1], budget))
+        self.last_request_at = time.monotonic()
+        body = json_codec.dumps(payload)
+        compressed = bool(self.compress_min_bytes) and len(body) >= self.compress_min_bytes
+        send_headers, data = headers, body
+        if compressed:
+            send_headers, data = dict(headers, **{"Content-Encoding": "gzip"}), gzip.compress(body, 6)
+        try:
+            response = self.session.post(url, headers=send_headers, data=data, timeout=timeout, stream=stream)
+            if compressed and response.status_code in (400, 415):
+                # يمكن السيرفر مش بيقبل gzip: نبعت مرة تانية من غير ضغط
+                rejected = response.status_code
+                response.close()
+                response = self.session.post(url, headers=headers, data=body, timeout=timeout, stream=stream)
+                # 400 برضه من غير ضغط = الطلب نفسه غلط، مش الـ gzip
+                if rejected == 415 or response.status_code != 400:
+                    self.compress_min_bytes = None
+        except requests.Timeout as e:
+            raise GeminiError(f"Request timed out: {e}", timed_out=True) from e
+        except requests.RequestException as e:
+            raise GeminiError(f"Connection error: {e}") from e
+        if response.status_code != 200:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is None:
+                retry_after = parse_retry_delay(response.text)
+            error = GeminiError(f"API Error {response.status_code}: {response.text}",
+                                status_code=response.status_code, body=response.text,
+                                retry_after=retry_after)
+            # الـ provider بيعرف أنهي مفتاح اتقفل (KeyPool)
+            self.provider.report(headers, error)
+            raise error
+        return response
+
+    def _post(self, url, payload, stream=False, model=None, deadline_at=None, priority=INTERACTIVE, sent=None,
+              held=False):
+        # إعادة المحاولة مع backoff؛ الـ rate limiter بيتسأل قبل كل محاولة
+        # الـ slot الأول (حسب الأولوية) وبعدين الـ rate limiter، عشان الطلب التفاعلي ما يستناش ورا الـ batch
+        # held = الـ slot بتاع أول محاولة اتحجز قبل كده (في thread اللي بينادي)
+        if not held:
+            self.provider.ready()
+        attempt = 0
+        while True:
+            attempt += 1
+            if not held:
+                self.concurrency.acquire(priority, deadline_at)
+            held = False
+            try:
+                self.rate_limiter.acquire(model or self.model, deadline_at)
+                if remaining(deadline_at) == 0:
+                    raise GeminiError("Deadline exceeded.", timed_out=True)
+                headers = self.provider.headers(deadline_at)
+            except GeminiError:
+                # الـ deadline خلص وهو مستني محلياً: السيرفر ما شافش الطلب، فمفيش عقاب للـ AIMD
+                self.concurrency.cancel()
+                raise
+            started = time.monotonic()
+            if sent:
+                sent.set()
+            try:
+                response = self._send(url, payload, headers, stream=stream, deadline_at=deadline_at)
+            except GeminiError as e:
+                # timeout لأن الـ deadline بتاعنا خلص مش علامة إن السيرفر مضغوط
+                overloaded = e.overloaded and not (e.timed_out and remaining(deadline_at) == 0)
+                self.concurrency.release(time.monotonic() - started, ok=False, overloaded=overloaded)
+                if not self.retry_policy.should_retry(e, attempt):
+                    raise
+                if e.status_code == 429 and self.provider.can_failover():
+                    delay = 0  # فيه مفتاح تاني متاح، مفيش داعي نستنى
+                else:
+                    delay = self.retry_policy.delay(attempt, e.retry_after)
+                budget = remaining(deadline_at)
+                if budget is not None and delay >= budget:
+                    raise
+                time.sleep(delay)
+                continue
+            if not stream:
+                self.concurrency.release(time.monotonic() - started)
+                if self.hedger:
+                    # وقت الطلب على السلك بس، من غير انتظار الـ slot أو الـ backoff
+                    self.hedger.record(time.monotonic() - started)
+            # في الـ stream الـ slot بيفضل محجوز لحد ما stream_content يقفل
+            return response
+
+    def build_payload(self, prompt):
+        return self.provider.build_payload(prompt)
+
+    def post_json(self, url, body, model=None):
+        return json_codec.loads(self._post(url, body, model=model).content)
+
+    def delete(self, url):
+        try:
+            response = self.session.delete(url, headers=self.provider.headers(), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise GeminiError(f"Connection error: {e}") from e
+        if response.status_code not in (200, 204):
+            raise GeminiError(f"API Error {response.status_code}: {response.text}",
+                              status_code=response.status_code, body=response.text)
+
+    def request_key(self, payload, model=None):
+        raw = json.dumps({"model": model or self.model, "payload": payload}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _meter(self, reply, model):
+        if self.meter:
+            self.meter.record(reply.get("usageMetadata"), model or self.model)
+
+    def _meter_stream(self, chunks, payload, model):
+        # usageMetadata بييجي في آخر chunk؛ الـ stream اللي اتقفل بدري ما بيوصلوش فبنقدّر التوكنز محلياً
+        if not self.meter or not chunks:
+            return
+        usage = chunks[-1].get("usageMetadata")
+        if not usage:
+            prompt = estimate_tokens("".join(part.get("text", "") for content in payload.get("contents", [])
+                                             for part in content.get("parts", [])))
+            candidates = estimate_tokens("".join(self.provider.chunk_text(chunk) for chunk in chunks))
+            usage = {"promptTokenCount": prompt, "candidatesTokenCount": candidates,
+                     "totalTokenCount": prompt + candidates}
+        self.meter.record(usage, model or self.model)
+
+    def _replay(self, key, kind):
+        recorded = self.cassette.replay(key, kind)
+        if recorded is None:
+            raise GeminiError("Cassette has no recording for this request.", status_code=404)
+        return recorded
+
+    def generate_content(self, payload, model=None, deadline=None, priority=INTERACTIVE):
+        # بيرجع الـ JSON الخام من generateContent؛ deadline بالثواني من دلوقتي
+        deadline_at = time.monotonic() + deadline if deadline else None
+        key = self.request_key(payload, model)
+        if self.cassette and self.cassette.replaying:
+            reply, latency = self._replay(key, "generate")
+            self.cassette.wait(latency)
+            self._meter(reply, model)
+            return reply
+        url = self._url(model, "generateContent")
+
+        def attempt(sent=None, held=False):
+            started = time.monotonic()
+            reply = json_codec.loads(self._post(url, payload, model=model, deadline_at=deadline_at,
+                                                priority=priority, sent=sent, held=held).content)
+            # كل محاولة بتتحسب (حتى طلبات الـ hedging) لأنها بتتحاسب
+            self._meter(reply, model)
+            if self.cassette and self.cassette.recording:
+                self.cassette.record(key, "generate", reply, time.monotonic() - started)
+            return reply
+
+        def call():
+            if not self.hedger:
+                return attempt()
+            # الـ executor بتاع الـ hedging بيخدم بالترتيب، فالـ slot الأول بيتحجز هنا بالأولوية قبل ما ندخله؛
+            # كده الطلب التفاعلي ما يستناش ورا الـ batch في طابور الـ threads
+            self.provider.ready()
+            self.concurrency.acquire(priority, deadline_at)
+            return self.hedger.call(attempt, deadline_at, first=lambda sent: attempt(sent, held=True))
+
+        # الطلبات المتطابقة اللي شغالة في نفس اللحظة بتستنى نداء واحد بس
+        return self.single_flight.do(key, call)
+
+    def _cache_key(self, text, model, generation_config=None):
+        return self.cache.make_key(model or self.model, generation_config, text)
+
+    def _payload(self, prompt, model, prefix, generation_config=None):
+        # prefix = جزء ثابت مشترك بين طلبات كتير (زي الـ CV والتعليمات)
+        if prefix and self.context_cache:
+            payload = self.context_cache.payload_for(prefix, prompt, model or self.model)
+        else:
+            payload = self.build_payload((prefix or "") + prompt)
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return payload
+
+    def _stale_answer(self, prompt, models, prefix, generation_config, task, error):
+        # لما Gemini واقع: آخر رد متخزن لنفس الطلب (معلّم إنه stale) من أي موديل في السلسلة،
+        # حتى اللي اتعلّم إنه واقع، لأن الرد ممكن يكون اتخزن تحت موديل تاني
+        if not (self.stale_fallback and self.cache) or not (isinstance(error, CircuitOpenError) or counts_as_outage(error)):
+            return None
+        # الميزانية خلصت: لازم المستخدم يعرف، مش ياخد رد قديم على إن Gemini واقع
+        if isinstance(error, BudgetExceededError):
+            return None
+        candidates = list(models)
+        if task and self.router:
+            tokens = estimate_tokens(prefix) + estimate_tokens(prompt)
+            candidates += [m for m in self.router.chain(task, tokens, include_down=True) if m not in candidates]
+        for name in candidates:
+            stale = self.cache.get_stale(self._cache_key((prefix or "") + prompt, name, generation_config))
+            if stale is not None:
+                return stale
+        return None
+
+    def _route(self, prompt, model, prefix, task):
+        # موديل محدد أو مفيش task = من غير routing
+        if model or not task or not self.router:
+            return [model or self.model]
+        models = self.router.chain(task, estimate_tokens(prefix) + estimate_tokens(prompt))
+        if not models:
+            # 400 = مشكلة في الطلب نفسه، فلا retry ولا رد قديم
+            raise GeminiError("Prompt exceeds every model's context window.", status_code=400)
+        return models
+
+    def generate(self, prompt, model=None, use_cache=True, prefix=None, generation_config=None, deadline=None,
+                 task=None, priority=INTERACTIVE):
+        """Return the reply text; task ("match_score", "enhanced_cv", ...) lets the router pick the model.
+
+        priority is "interactive" (someone is waiting on it) or "batch".
+        """
+        deadline_at = time.monotonic() + deadline if deadline else None
+        models = self._route(prompt, model, prefix, task)
+        for i, name in enumerate(models):
+            last = i == len(models) - 1
+            try:
+                text = self._generate(prompt, name, use_cache, prefix, generation_config,
+                                      remaining(deadline_at), priority=priority)
+            except GeminiError as e:
+                if last or not should_fallback(e) or remaining(deadline_at) == 0:
+                    stale = self._stale_answer(prompt, models, prefix, generation_config, None if model else task, e)
+                    if stale is not None:
+                        return stale
+                    raise
+                # الموديل ده مش متاح، نجرب اللي بعده في السلسلة
+                self.router.mark_unavailable(name, e)
+                continue
+            if task and self.router:
+                self.router.record(name)
+            return text
+
+    def _generate(self, prompt, model, use_cache, prefix, generation_config, deadline, priority=INTERACTIVE):
+        key = self._cache_key((prefix or "") + prompt, model, generation_config) if self.cache else None
+        if key and use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        if self.meter:
+            self.meter.check()
+        try:
+            if self.breaker:
+                self.breaker.before_call()
+            payload = self._payload(prompt, model, prefix, generation_config)
+            reply = self.generate_content(payload, model=model, deadline=deadline, priority=priority)
+        except Exception as e:
+            # أي خطأ (حتى رد مش JSON) لازم يوصل للـ breaker، وإلا الـ probe يفضل معلّق
+            if self.breaker and not isinstance(e, CircuitOpenError):
+                self.breaker.record_failure(e)
+            raise
+        if self.breaker:
+            self.breaker.record_success()
+        text = self.provider.extract_text(reply)
+        if text is None:
+            return "❌ No response."
+        if key:
+            self.cache.put(key, text)
+        return text
+
+    def generate_candidates(self, prompt, count, model=None, prefix=None, generation_config=None, task=None,
+                            priority=INTERACTIVE):
+        """Ask for up to count alternative answers in one call (candidateCount).
+
+        Always goes to the API (it is meant for regenerating); returns the
+        texts in the order Gemini ranked them.
+        """
+        config = dict(generation_config or {}, candidateCount=max(1, min(count, MAX_CANDIDATES)))
+        models = self._route(prompt, model, prefix, task)
+        for i, name in enumerate(models):
+            if self.meter:
+                self.meter.check()
+            try:
+                if self.breaker:
+                    self.breaker.before_call()
+                reply = self.generate_content(self._payload(prompt, name, prefix, config), model=name, priority=priority)
+            except Exception as e:
+                if self.breaker and not isinstance(e, CircuitOpenError):
+                    self.breaker.record_failure(e)
+                if not isinstance(e, GeminiError) or i == len(models) - 1 or not should_fallback(e):
+                    raise
+                self.router.mark_unavailable(name, e)
+                continue
+            if self.breaker:
+                self.breaker.record_success()
+            if task and self.router:
+                self.router.record(name)
+            return self.provider.extract_candidates(reply)
+
+    def stream_content(self, payload, model=None, priority=INTERACTIVE):
+        # streamGenerateContent بصيغة SSE: كل سطر "data: {...}" فيه جزء من الرد
+        key = self.request_key(payload, model)
+        if self.cassette and self.cassette.replaying:
+            chunks, latency = self._replay(key, "stream")
+            replayed = []
+            try:
+                for chunk in chunks:
+                    self.cassette.wait(latency / max(1, len(chunks)))
+                    replayed.append(chunk)
+                    yield chunk
+            finally:
+                self._meter_stream(replayed, payload, model)
+            return
+        url = self._url(model, "streamGenerateContent") + "?alt=sse"
+        started = time.monotonic()
+        response = self._post(url, payload, stream=True, model=model, priority=priority)
+        response.encoding = "utf-8"
+        ok = False
+        recorded = []
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                chunk = json_codec.loads(line[len("data:"):].strip())
+                recorded.append(chunk)
+                yield chunk
+            ok = True
+        except GeneratorExit:
+            # اللي بيقرا قفل بدري (زي وضع الترتيب) = الطلب نجح، مش فشل
+            ok = True
+            raise
+        except requests.RequestException as e:
+            raise GeminiError(f"Stream interrupted: {e}") from e
+        finally:
+            response.close()
+            self.concurrency.release(time.monotonic() - started, ok=ok)
+            self._meter_stream(recorded, payload, model)
+            # بنسجل اللي وصل لحد القفل عشان الـ replay يمشي نفس المشوار
+            if ok and self.cassette and self.cassette.recording:
+                self.cassette.record(key, "stream", recorded, time.monotonic() - started)
+
+    def stream(self, prompt, model=None, use_cache=True, prefix=None, task=None, generation_config=None,
+               priority=INTERACTIVE):
+        # generator بيطلع النص أول بأول؛ الـ fallback لموديل تاني بس قبل أول جزء
+        # لو اللي بيقرا قفل الـ generator بدري (close) الاتصال بيتقفل والرد الناقص ما بيتخزنش
+        models = self._route(prompt, model, prefix, task)
+        for i, name in enumerate(models):
+            last = i == len(models) - 1
+            started = False
+            try:
+                for text in self._stream(prompt, name, use_cache, prefix, generation_config, priority=priority):
+                    started = True
+                    yield text
+            except GeminiError as e:
+                if started:
+                    raise
+                if last or not should_fallback(e):
+                    stale = self._stale_answer(prompt, models, prefix, generation_config, None if model else task, e)
+                    if stale is None:
+                        raise
+                    yield stale
+                    return
+                self.router.mark_unavailable(name, e)
+                continue
+            if task and self.router:
+                self.router.record(name)
+            return
+
+    def _stream(self, prompt, model, use_cache, prefix, generation_config=None, priority=INTERACTIVE):
+        key = self._cache_key((prefix or "") + prompt, model, generation_config) if self.cache else None
+        if key and use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        if self.meter:
+            self.meter.check()
+        pieces = []
+        try:
+            if self.breaker:
+                self.breaker.before_call()
+            payload = self._payload(prompt, model, prefix, generation_config)
+            chunks = self.stream_content(payload, model=model, priority=priority)
+            for chunk in chunks:
+                text = self.provider.chunk_text(chunk)
+                if text:
+                    pieces.append(text)
+                    yield text
+        except GeneratorExit:
+            # قفل بدري من اللي بيقرا: الموديل كان شغال، فالـ breaker يعتبرها نجاح (وإلا الـ probe يفضل معلّق)
+            chunks.close()
+            if self.breaker:
+                self.breaker.record_success()
+            raise
+        except Exception as e:
+            if self.breaker and not isinstance(e, CircuitOpenError):
+                self.breaker.record_failure(e)
+            raise
+        if self.breaker:
+            self.breaker.record_success()
+        if key and pieces:
+            self.cache.put(key, "".join(pieces))
+
+    def warm_up(self, connections=2, keepalive=45.0):
+        """Open pooled connections in a background thread and keep them alive.
+
+        Pings the provider's warm-up URL from `connections` threads at once
+        so the pool holds that many ready connections, then re-pings every
+        `keepalive` seconds while no real request has used them.
+        """
+        url = self.provider.warmup_url()
+        if not url or (self.cassette and self.cassette.replaying):
+            return
+        if self._warmer and self._warmer.is_alive():
+            return
+        self._warm_stop.clear()
+        self._warmer = threading.Thread(target=self._warm_loop, args=(url, connections, keepalive),
+                                        daemon=True, name="gemini-warmup")
+        self._warmer.start()
+
+    def _ping(self, url, connections):
+        def ping():
+            try:
+                self.session.head(url, timeout=self.timeout[0]).close()
+            except requests.RequestException:
+                pass  # الطلب الحقيقي هيعيد المحاولة ويطلع الخطأ
+        threads = [threading.Thread(target=ping, daemon=True) for _ in range(max(1, min(connections, self.pool_size)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.warm_pings += len(threads)
+
+    def _warm_loop(self, url, connections, keepalive):
+        self._ping(url, connections)
+        # السيرفر بيقفل الاتصالات الساكتة، فبنفكره طول ما المستخدم لسه في القوايم
+        while not self._warm_stop.wait(keepalive):
+            if time.monotonic() - self.last_request_at >= keepalive:
+                self._ping(url, connections)
+
+    async def agenerate(self, prompt, model=None, use_cache=True, prefix=None, task=None, priority=INTERACTIVE):
+        # requests مش async، فبنشغله في thread من غير ما نوقف الـ event loop
+        return await asyncio.to_thread(self.generate, prompt, model, use_cache, prefix, task=task, priority=priority)
+
+    def metrics(self):
+        metrics = self.concurrency.metrics()
+        metrics["warm_pings"] = self.warm_pings
+        if self.hedger:
+            metrics.update(self.hedger.metrics())
+        if self.breaker:
+            metrics.update(self.breaker.metrics())
+        if self.router:
+            metrics.update(self.router.metrics())
+        key_pool = getattr(self.provider, "key_pool", None)
+        if key_pool:
+            metrics["keys"] = key_pool.metrics()
+        return metrics
+
+    def close(self):
+        self._warm_stop.set()
+        if self.context_cache:
+            self.context_cache.cleanup()
+        self.session.close()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def _default_key_pool():
+    # GEMINI_API_KEYS=key1,key2,... لتوزيع الحمل على كذا مشروع
+    keys = [k for k in os.getenv("GEMINI_API_KEYS", "").split(",") if k.strip()]
+    return KeyPool(keys) if len(keys) > 1 else None
+
+
+def _default_cache():
+    # GEMINI_CACHE=0 بيقفل الكاش، و GEMINI_CACHE_TTL بالثواني
+    if os.getenv("GEMINI_CACHE", "1") == "0":
+        return None
+    ttl = os.getenv("GEMINI_CACHE_TTL")
+    return ResponseCache(os.getenv("GEMINI_CACHE_PATH", DEFAULT_CACHE_PATH),
+                         ttl=float(ttl) if ttl else None,
+                         # الردود المنتهية بتفضل أسبوع كاحتياطي لو Gemini وقع
+                         keep_stale=7 * 24 * 3600)
+
+
+def _default_router():
+    # GEMINI_ROUTE_TARGET=fast|balanced|quality، و GEMINI_MAX_CALL_COST بالدولار لكل طلب
+    max_cost = os.getenv("GEMINI_MAX_CALL_COST")
+    return ModelRouter(os.getenv("GEMINI_ROUTE_TARGET", "balanced"), float(max_cost) if max_cost else None)
+
+
+def build_client(api_key=API_KEY, endpoint=DEFAULT_ENDPOINT):
+    """A client with the shared configuration (env vars, hedging, routing, ...)."""
+    rpm = os.getenv("GEMINI_RPM")
+    key_pool = _default_key_pool()
+    n_keys = len(key_pool) if key_pool else 1
+    # ضغط الطلبات الكبيرة بيتفعّل لوحده بس مع GEMINI_ENDPOINT؛ مع Gemini نفسه لازم GEMINI_GZIP_MIN_BYTES صريح
+    gzip_min = os.getenv("GEMINI_GZIP_MIN_BYTES", "65536" if os.getenv("GEMINI_ENDPOINT") else "0")
+    client = GeminiClient(cache=_default_cache(), breaker=CircuitBreaker(), stale_fallback=True,
+                          meter=UsageMeter(), router=_default_router(),
+                          compress_min_bytes=int(gzip_min) or None,
+                          # GEMINI_RPM لكل مفتاح ولكل موديل (الـ quota بتاعة Gemini لكل موديل)
+                          rpm_limits={m: int(rpm) * n_keys for m in MODEL_LADDER} if rpm else None,
+                          provider=GeminiProvider(api_key, endpoint, key_pool))
+    if not key_pool:
+        # الـ cachedContents تبع مشروع المفتاح اللي عمله، فمش بتنفع مع كذا مفتاح
+        client.context_cache = ContextCacheManager(client)
+        atexit.register(client.context_cache.cleanup)
+    # GEMINI_HEDGE_RATE=0 بيقفل الـ hedging
+    hedge_rate = float(os.getenv("GEMINI_HEDGE_RATE", "0.05"))
+    if hedge_rate > 0:
+        client.hedger = HedgedCaller(max_hedge_rate=hedge_rate)
+    return client
+
+
+def get_client():
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = build_client()
+        return _shared_client
+
+
+def use_cassette(path, mode, latency_scale=0.0):
+    """Record or replay all traffic of the shared client.
+
+    The response cache and context caching are turned off so every call
+    reaches the cassette with the same inline payload in both modes.
+    """
+    client = get_client()
+    if client.context_cache:
+        client.context_cache.cleanup()
+    client.cassette = Cassette(path, mode, latency_scale)
+    client.cache = None
+    client.context_cache = None
+    return client.cassette
+
+
+def warm_up():
+    # بيتنادى أول ما جلسة تفاعلية تبدأ؛ GEMINI_WARMUP=0 بيقفله
+    if os.getenv("GEMINI_WARMUP", "1") != "0":
+        get_client().warm_up()
+
+
+def error_text(error):
+    # نفس شكل رسايل الخطأ القديمة اللي بيرجعها ask_gemini
+    return f"❌ {error}" if error.status_code else f"❌ Error: {error}"
+
+
+def ask_gemini(prompt, use_cache=True, prefix=None, generation_config=None, deadline=None, task=None,
+               priority=INTERACTIVE):
+    try:
+        return get_client().generate(prompt, use_cache=use_cache, prefix=prefix, generation_config=generation_config,
+                                     deadline=deadline, task=task, priority=priority)
+    except GeminiError as e:
+        return error_text(e)
+
+
+def ask_gemini_candidates(prompt, count, task=None):
+    # بيرجع list؛ لو فيه خطأ بيرجع رسالة الخطأ كعنصر واحد
+    try:
+        return get_client().generate_candidates(prompt, count, task=task) or ["❌ No response."]
+    except GeminiError as e:
+        return [error_text(e)]
+
+
+def ask_gemini_stream(prompt, use_cache=True, task=None, prefix=None, generation_config=None, priority=INTERACTIVE):
+    # زي ask_gemini بس بيرجع النص على أجزاء؛ الخطأ بيطلع كآخر جزء
+    try:
+        yield from get_client().stream(prompt, use_cache=use_cache, task=task, prefix=prefix,
+                                       generation_config=generation_config, priority=priority)
+    except GeminiError as e:
+        yield error_text(e)
+
+
+async def ask_gemini_async(prompt, client=None):
+    try:
+        return await (client or get_client()).agenerate(prompt)
+    except GeminiError as e:
+        return error_text(e)
+
+
+async def gather_prompts(prompts, max_concurrency=5, client=None, return_exceptions=False):
+    """Run prompts concurrently, at most max_concurrency in flight.
+
+    Results come back in input order. A failed prompt yields its error
+    string (or the GeminiError itself with return_exceptions=True)
+    without affecting the others.
+    """
+    client = client or get_client()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(prompt):
+        async with semaphore:
+            try:
+                return await client.agenerate(prompt, priority=BATCH)
+            except GeminiError as e:
+                if return_exceptions:
+                    return e
+                return error_text(e)
+
+    return await asyncio.gather(*(run(p) for p in prompts))
@@ -0,0 +1,119 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from utils.llm_providers import GeminiError
+
+
+def remaining(deadline_at):
+    # الوقت الباقي لحد الـ deadline (None = مفيش deadline)
+    if deadline_at is None:
+        return None
+    return max(0.0, deadline_at - time.monotonic())
+
+
+class LatencyTracker:
+    """Sliding window of recent request latencies."""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, latency):
+        with self.lock:
+            self.samples.append(latency)
+
+    def percentile(self, p):
+        with self.lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class HedgedCaller:
+    """Send a duplicate request when the first is slower than the observed p95.
+
+    Whichever attempt answers first wins; the loser is left to finish in the
+    background. Hedges are capped at max_hedge_rate of all calls, and no hedge
+    is sent until min_samples latencies have been observed.
+
+    Latencies come from record() (time on the wire only, not queueing or
+    backoff), and the hedge timer starts once the first attempt has
+    actually been sent: fn gets a threading.Event it sets at that moment.
+    first, if given, runs the first attempt instead of fn (e.g. one that
+    already holds its concurrency slot).
+    """
+
+    def __init__(self, percentile=0.95, max_hedge_rate=0.05, min_samples=20, max_workers=16):
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.tracker = LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-hedge")
+        self.calls = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def _hedge_delay(self):
+        if len(self.tracker) < self.min_samples:
+            return None
+        return self.tracker.percentile(self.percentile)
+
+    def _take_hedge_slot(self):
+        with self.lock:
+            if self.hedges + 1 > self.max_hedge_rate * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def record(self, latency):
+        self.tracker.add(latency)
+
+    @staticmethod
+    def _run(fn, sent):
+        try:
+            return fn(sent)
+        finally:
+            # لو فشل قبل ما يتبعت، ما نفضلش مستنيين الـ event
+            sent.set()
+
+    def call(self, fn, deadline_at=None, first=None):
+        with self.lock:
+            self.calls += 1
+        sent = threading.Event()
+        pending = [self.executor.submit(self._run, first or fn, sent)]
+        delay = self._hedge_delay()
+        if delay is not None:
+            # الوقت في طابور الـ slots مش تأخير من السيرفر، فالعداد يبدأ لما الطلب يتبعت فعلاً
+            sent.wait(remaining(deadline_at))
+            budget = remaining(deadline_at)
+            done, _ = wait(pending, timeout=delay if budget is None else min(delay, budget))
+            if not done and remaining(deadline_at) != 0 and self._take_hedge_slot():
+                pending.append(self.executor.submit(self._run, fn, threading.Event()))
+
+        last_error = None
+        while pending:
+            done, not_done = wait(pending, timeout=remaining(deadline_at), return_when=FIRST_COMPLETED)
+            if not done:
+                raise GeminiError("Deadline exceeded.", timed_out=True)
+            for future in done:
+                try:
+                    result = future.result()
+                except GeminiError as e:
+                    last_error = e
+                    continue
+                return result
+            pending = list(not_done)
+        raise last_error
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "hedged_requests": self.hedges,
+                "hedge_rate": round(self.hedges / self.calls, 3) if self.calls else 0.0,
+                "p95_latency": self.tracker.percentile(self.percentile),
+            }
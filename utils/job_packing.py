@@ -0,0 +1,109 @@
+import json
+import re
+from utils.prompt_budget import estimate_tokens
+
+# مساحة الرد لكل وظيفة في الـ JSON (score + missing skills)
+OUTPUT_TOKENS_PER_JOB = 200
+MAX_OUTPUT_TOKENS = 8192
+
+PACKED_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "job_id": {"type": "INTEGER"},
+            "score": {"type": "INTEGER"},
+            "missing_skills": {"type": "ARRAY", "items": {"type": "STRING"}},
+        },
+        "required": ["job_id", "score", "missing_skills"],
+    },
+}
+
+PACKED_GENERATION_CONFIG = {
+    "responseMimeType": "application/json",
+    "responseSchema": PACKED_SCHEMA,
+    "maxOutputTokens": MAX_OUTPUT_TOKENS,
+}
+
+
+def plan_packs(job_descs, token_budget, fixed_tokens=0):
+    """Group job indexes greedily so each pack fits the input token budget.
+
+    A job that is too large on its own still gets a pack of one.
+    """
+    max_jobs = max(1, MAX_OUTPUT_TOKENS // OUTPUT_TOKENS_PER_JOB)
+    available = max(1, token_budget - fixed_tokens)
+    packs, current, used = [], [], 0
+    for idx, job_desc in enumerate(job_descs):
+        cost = estimate_tokens(job_desc)
+        if current and (used + cost > available or len(current) >= max_jobs):
+            packs.append(current)
+            current, used = [], 0
+        current.append(idx)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def build_packed_prefix(cv_content, instruction_text):
+    return f"""
+This is a quick screening request: compare one CV against several job descriptions.
+CV:
+---
+{cv_content}
+---
+Additional Instructions:
+{instruction_text}
+---
+For EVERY job below, estimate a match score out of 100 and list the missing skills/certifications needed to reach 90/100.
+Answer ONLY with a JSON array containing one object per job:
+[{{"job_id": <id>, "score": <0-100>, "missing_skills": ["...", "..."]}}]
+"""
+
+
+def build_packed_prompt(jobs):
+    # jobs = [(job_id, job_desc), ...]
+    sections = [f"""
+Job ID: {job_id}
+---
+{job_desc}
+---""" for job_id, job_desc in jobs]
+    return "\n".join(sections) + "\n"
+
+
+def parse_packed_reply(text, expected_ids):
+    """Return ({job_id: (score, missing_skills)}, [job_ids with no valid answer])."""
+    answers = {}
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        # أحياناً الرد بيجي جوه ```json ... ```
+        match = re.search(r"\[.*\]", text or "", re.DOTALL)
+        try:
+            data = json.loads(match.group(0)) if match else []
+        except ValueError:
+            data = []
+    if not isinstance(data, list):
+        data = []
+    expected = set(expected_ids)
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        try:
+            job_id = int(item.get("job_id"))
+            score = int(item.get("score"))
+        except (TypeError, ValueError):
+            continue
+        skills = item.get("missing_skills") or []
+        if job_id in expected and 0 <= score <= 100 and isinstance(skills, list):
+            answers[job_id] = (score, [str(skill) for skill in skills])
+    missing = [job_id for job_id in expected_ids if job_id not in answers]
+    return answers, missing
+
+
+def format_packed_answer(score, missing_skills):
+    # نفس الشكل اللي extract_score_and_missing_skills بيفهمه
+    lines = [f"Match Score: {score}/100", "", "Missing Skills to reach 90/100:"]
+    lines += [f"- {skill}" for skill in missing_skills]
+    return "\n".join(lines) + "\n\n(Quick screening result — packed mode)"
@@ -0,0 +1,34 @@
+import json
+
+# orjson أسرع بكتير مع البرومبتات الكبيرة؛ لو مش متسطب بنرجع للـ json العادي
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_fast = orjson
+
+
+def name():
+    return "orjson" if _fast else "json"
+
+
+def use(codec):
+    """Pick "orjson" or "json" at runtime (falls back to json if orjson is missing)."""
+    global _fast
+    _fast = orjson if codec == "orjson" else None
+    return name()
+
+
+def dumps(obj):
+    """Serialise to UTF-8 bytes (what goes on the wire)."""
+    if _fast:
+        return _fast.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """Parse bytes or str."""
+    if _fast:
+        return _fast.loads(data)
+    return json.loads(data)
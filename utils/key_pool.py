@@ -0,0 +1,100 @@
+import re
+import time
+import threading
+from utils.llm_providers import GeminiError
+
+
+class _KeyState:
+    def __init__(self, key):
+        self.key = key
+        self.limit = None          # requests/minute learned from 429 quotaValue
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.blocked_until = 0.0
+        self.disabled = False
+        self.requests = 0
+        self.throttled = 0
+
+    def remaining(self, now):
+        if now - self.window_start >= 60:
+            self.window_start, self.used = now, 0
+        if self.limit is None:
+            return float("inf")
+        return self.limit - self.used
+
+
+class KeyPool:
+    """Spread requests over several API keys with per-key quota tracking.
+
+    Each request goes to the available key with the most remaining quota
+    (least used when no limit is known yet). A 429 takes the key out of
+    rotation until its Retry-After/cooldown passes and records the quota
+    limit reported in the error body; 401/403 disables the key for good.
+    """
+
+    def __init__(self, keys, cooldown=60.0):
+        keys = [k.strip() for k in keys if k and k.strip()]
+        if not keys:
+            raise ValueError("KeyPool needs at least one API key.")
+        self.states = {key: _KeyState(key) for key in dict.fromkeys(keys)}
+        self.cooldown = cooldown
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.states)
+
+    def _available(self, now):
+        return [s for s in self.states.values()
+                if not s.disabled and s.blocked_until <= now and s.remaining(now) > 0]
+
+    def acquire(self, deadline_at=None):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                available = self._available(now)
+                if available:
+                    state = max(available, key=lambda s: (s.remaining(now), -s.used))
+                    state.used += 1
+                    state.requests += 1
+                    return state.key
+                live = [s for s in self.states.values() if not s.disabled]
+                if not live:
+                    # 403 عشان ما يتعملش retry ولا يتحسب إن Gemini واقع
+                    raise GeminiError("All API keys are disabled.", status_code=403)
+                # نستنى لحد ما أقرب مفتاح يرجع (cooldown أو دقيقة جديدة)
+                wake = min(max(s.blocked_until, s.window_start + 60 if s.remaining(now) <= 0 else 0) for s in live)
+                if deadline_at is not None and wake >= deadline_at:
+                    raise GeminiError("Deadline exceeded while waiting for an available API key.", timed_out=True)
+                self.cond.wait(max(0.05, wake - now))
+
+    def has_spare(self):
+        with self.cond:
+            return bool(self._available(time.monotonic()))
+
+    def report(self, key, status_code=None, retry_after=None, body=None):
+        state = self.states.get(key)
+        if state is None or status_code is None:
+            return
+        with self.cond:
+            if status_code == 429:
+                state.throttled += 1
+                state.blocked_until = time.monotonic() + (retry_after or self.cooldown)
+                match = re.search(r'"quotaValue"\s*:\s*"?(\d+)', body or "")
+                if match:
+                    state.limit = int(match.group(1))
+            elif status_code in (401, 403):
+                state.disabled = True
+            self.cond.notify_all()
+
+    def metrics(self):
+        with self.cond:
+            now = time.monotonic()
+            return {
+                f"key_{i + 1}": {
+                    "requests": s.requests,
+                    "throttled": s.throttled,
+                    "remaining": None if s.limit is None else max(0, s.remaining(now)),
+                    "available": not s.disabled and s.blocked_until <= now,
+                }
+                for i, s in enumerate(self.states.values())
+            }
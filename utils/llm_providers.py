@@ -0,0 +1,121 @@
+class GeminiError(Exception):
+    def __init__(self, message, status_code=None, body=None, retry_after=None, timed_out=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+        self.timed_out = timed_out
+
+    @property
+    def overloaded(self):
+        # علامات إن الـ quota أو السيرفر مضغوطين
+        return self.timed_out or self.status_code in (429, 503)
+
+
+class LLMProvider:
+    """Where requests go and how replies are read.
+
+    GeminiClient keeps the transport concerns (pooling, retries, caching,
+    concurrency); a provider only knows its URLs, auth headers and the
+    shape of its JSON replies.
+    """
+
+    name = "base"
+
+    def url(self, model, method):
+        raise NotImplementedError
+
+    def resource_url(self, path):
+        raise NotImplementedError
+
+    def ready(self):
+        # بيرمي GeminiError لو الـ credentials ناقصة
+        pass
+
+    def warmup_url(self):
+        # URL رخيص نفتح بيه الاتصال (DNS + TCP + TLS) قبل أول طلب؛ None = مفيش
+        return None
+
+    def headers(self, deadline_at=None):
+        return {}
+
+    def report(self, headers, error=None):
+        # بعد كل محاولة: error = None لو نجحت
+        pass
+
+    def can_failover(self):
+        # True لو فيه credentials تانية نقدر نجربها فوراً بعد 429
+        return False
+
+    def build_payload(self, prompt):
+        raise NotImplementedError
+
+    def extract_text(self, reply):
+        raise NotImplementedError
+
+    def extract_candidates(self, reply):
+        # كل البدائل لما الطلب يطلب أكتر من candidate
+        raise NotImplementedError
+
+    def chunk_text(self, chunk):
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key, endpoint, key_pool=None):
+        self.api_key = api_key
+        self.endpoint = endpoint.rstrip("/")
+        # KeyPool لتوزيع الطلبات على كذا مفتاح
+        self.key_pool = key_pool
+
+    def url(self, model, method):
+        return f"{self.endpoint}/models/{model}:{method}"
+
+    def resource_url(self, path):
+        # زي cachedContents/abc
+        return f"{self.endpoint}/{path}"
+
+    def warmup_url(self):
+        # من غير مفتاح: أي رد (حتى 403) كفاية إن الاتصال يتفتح، ومش بيتحسب من الـ quota
+        return f"{self.endpoint}/models"
+
+    def ready(self):
+        if not self.key_pool and not self.api_key:
+            raise GeminiError("API key not found.")
+
+    def headers(self, deadline_at=None):
+        if self.key_pool:
+            return {"X-Goog-Api-Key": self.key_pool.acquire(deadline_at)}
+        if not self.api_key:
+            raise GeminiError("API key not found.")
+        return {"X-Goog-Api-Key": self.api_key}
+
+    def report(self, headers, error=None):
+        if self.key_pool and error is not None:
+            self.key_pool.report(headers.get("X-Goog-Api-Key"), error.status_code, error.retry_after, error.body)
+
+    def can_failover(self):
+        return bool(self.key_pool and len(self.key_pool) > 1 and self.key_pool.has_spare())
+
+    def build_payload(self, prompt):
+        return {
+            "contents": [{"parts": [{"text": prompt}]}]
+        }
+
+    def extract_text(self, reply):
+        return reply.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text")
+
+    def extract_candidates(self, reply):
+        texts = []
+        for candidate in reply.get("candidates", []):
+            parts = candidate.get("content", {}).get("parts", [])
+            text = "".join(part.get("text", "") for part in parts)
+            if text:
+                texts.append(text)
+        return texts
+
+    def chunk_text(self, chunk):
+        parts = chunk.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
@@ -0,0 +1,152 @@
+import re
+import json
+
+MATCH_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "score": {"type": "INTEGER"},
+        "missing_skills": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "strengths": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "weaknesses": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "analysis": {"type": "STRING"},
+    },
+    "required": ["score", "missing_skills", "strengths", "weaknesses", "analysis"],
+    # الـ score والمهارات الأول عشان يبقوا أول حاجة في الرد
+    "propertyOrdering": ["score", "missing_skills", "strengths", "weaknesses", "analysis"],
+}
+
+MATCH_GENERATION_CONFIG = {
+    "responseMimeType": "application/json",
+    "responseSchema": MATCH_SCHEMA,
+}
+
+_SCORE_SLASH = re.compile(r"(\d{1,3})\s*/\s*100")
+_SCORE_PERCENT = re.compile(r"(\d{1,3})\s*%")
+_SKILLS_HEADING = re.compile(
+    r"(Missing Skills|Areas for Improvement|To reach \d+/100|To increase your score)", re.IGNORECASE)
+_BULLET_CHARS = "-*• \t"
+# في الـ JSON الجزئي: الرقم لازم يكون خلص (بعده فاصلة أو قوس)
+_JSON_SCORE = re.compile(r'"score"\s*:\s*(\d{1,3})\s*[,}\n]')
+_JSON_SKILLS = re.compile(r'"missing_skills"\s*:\s*(?=\[)')
+_DECODER = json.JSONDecoder()
+
+
+def _valid_score(value):
+    return value if 0 <= value <= 100 else None
+
+
+def parse_plain_match(text):
+    """Single pass over a plain-text reply: (score, missing_skills).
+
+    The score comes from the first line mentioning a score with NN/100 or
+    NN%, else the first NN/100, else the first NN% anywhere. Missing skills
+    are the lines under the first skills heading, up to the next blank line.
+    """
+    score_line = first_slash = first_percent = None
+    missing_skills = []
+    in_skills = False
+    for line in (text or "").splitlines():
+        stripped = line.strip()
+        if in_skills:
+            if not stripped:
+                if missing_skills:
+                    in_skills = False
+                continue
+            item = stripped.strip(_BULLET_CHARS).strip("*").strip()
+            if len(item) > 2:
+                missing_skills.append(item)
+            continue
+        if not missing_skills and _SKILLS_HEADING.search(stripped):
+            in_skills = True
+            # لو المهارات مكتوبة على نفس سطر العنوان بعد ":"
+            rest = stripped.split(":", 1)[1].strip(_BULLET_CHARS).strip("*").strip() if ":" in stripped else ""
+            if len(rest) > 2:
+                missing_skills.append(rest)
+            continue
+        if score_line is None:
+            slash = _SCORE_SLASH.search(stripped)
+            percent = _SCORE_PERCENT.search(stripped)
+            if slash and first_slash is None:
+                first_slash = _valid_score(int(slash.group(1)))
+            if percent and first_percent is None:
+                first_percent = _valid_score(int(percent.group(1)))
+            if (slash or percent) and "score" in stripped.lower():
+                score_line = _valid_score(int((slash or percent).group(1)))
+    for score in (score_line, first_slash, first_percent):
+        if score is not None:
+            return score, missing_skills
+    return None, missing_skills
+
+
+def parse_ranking_prefix(text):
+    """Return (score, missing_skills) as soon as both are complete, else None.
+
+    Works on a partial streamed reply: JSON (schema order puts score and
+    missing_skills first) or plain text, where the skills list is complete
+    once a blank line follows it.
+    """
+    text = text or ""
+    if text.lstrip().startswith("{"):
+        score = _JSON_SCORE.search(text)
+        skills = _JSON_SKILLS.search(text)
+        if not (score and skills):
+            return None
+        try:
+            items, _ = _DECODER.raw_decode(text, skills.end())
+        except ValueError:
+            return None  # الـ array لسه ما اتقفلش
+        if _valid_score(int(score.group(1))) is None or not isinstance(items, list):
+            return None
+        return int(score.group(1)), [str(item) for item in items]
+    score, missing_skills = parse_plain_match(text)
+    if score is None or not missing_skills:
+        return None
+    if not re.search(r"\n\s*\n", text[text.rfind(missing_skills[-1]):]):
+        return None
+    return score, missing_skills
+
+
+def parse_match_json(text):
+    # رد الـ schema؛ None لو الرد مش JSON سليم
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    try:
+        score = _valid_score(int(data.get("score")))
+    except (TypeError, ValueError):
+        return None
+    if score is None:
+        return None
+    return {
+        "score": score,
+        "missing_skills": [str(s) for s in data.get("missing_skills") or []],
+        "strengths": [str(s) for s in data.get("strengths") or []],
+        "weaknesses": [str(s) for s in data.get("weaknesses") or []],
+        "analysis": str(data.get("analysis") or ""),
+    }
+
+
+def render_match(data):
+    # نص مقروء للعرض والحفظ (TXT / PDF) بدل الـ JSON الخام
+    lines = [f"Match Score: {data['score']}/100", ""]
+    for title, key in (("Strengths", "strengths"), ("Weaknesses", "weaknesses"),
+                       ("Missing Skills to reach 90/100", "missing_skills")):
+        if data[key]:
+            lines.append(f"**{title}:**")
+            lines += [f"- {item}" for item in data[key]]
+            lines.append("")
+    if data["analysis"]:
+        lines += ["**Analysis:**", data["analysis"]]
+    return "\n".join(lines).strip() + "\n"
+
+
+def parse_match_result(text):
+    """Return (display_text, score, missing_skills) for a JSON or plain reply."""
+    data = parse_match_json(text)
+    if data is not None:
+        return render_match(data), data["score"], data["missing_skills"]
+    score, missing_skills = parse_plain_match(text)
+    return text, score, missing_skills
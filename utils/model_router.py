@@ -0,0 +1,103 @@
+import time
+import threading
+from utils.usage_meter import PRICES_PER_MILLION
+
+# من الأسرع والأرخص للأبطأ والأحسن جودة
+MODEL_LADDER = ["gemini-1.5-flash-8b", "gemini-1.5-flash", "gemini-2.0-flash", "gemini-1.5-pro"]
+
+CONTEXT_WINDOW = {
+    "gemini-1.5-flash-8b": 1_000_000,
+    "gemini-1.5-flash": 1_000_000,
+    "gemini-2.0-flash": 1_000_000,
+    "gemini-1.5-pro": 2_000_000,
+}
+
+# الدرجة على السلم لكل نوع طلب: الفرز الرخيص تحت، المستندات النهائية فوق
+TASK_TIERS = {
+    "match_score": 0,
+    "assessment": 1,
+    "summary": 1,
+    "proposal": 2,
+    "cover_letter": 3,
+    "enhanced_cv": 3,
+}
+
+# fast بينزل درجة، quality بيطلع درجة
+TARGET_SHIFT = {"fast": -1, "balanced": 0, "quality": 1}
+
+# الموديل الصغير بيضعف مع البرومبتات الطويلة
+LONG_PROMPT_TOKENS = 30_000
+EXPECTED_OUTPUT_TOKENS = 1_000
+
+
+def should_fallback(error):
+    # 404 = الموديل مش موجود/اتشال، 429 = الـ quota بتاعة الموديل ده خلصت، 5xx/timeout = مضغوط
+    return error.timed_out or error.status_code in (404, 429, 500, 502, 503, 504)
+
+
+class ModelRouter:
+    """Pick a model chain per call from task type, prompt size and target.
+
+    target is "fast", "balanced" or "quality". The chain starts at the
+    task's tier, then falls back to cheaper models and finally one tier up.
+    max_cost (USD per call) drops models whose estimated cost is higher,
+    keeping at least the cheapest one. A model that fails with an
+    availability error is skipped for cooldown seconds.
+    """
+
+    def __init__(self, target="balanced", max_cost=None, ladder=MODEL_LADDER, task_tiers=TASK_TIERS,
+                 cooldown=300.0, prices=PRICES_PER_MILLION):
+        if target not in TARGET_SHIFT:
+            raise ValueError(f"Unknown routing target: {target!r} (expected one of {', '.join(TARGET_SHIFT)})")
+        self.target = target
+        self.max_cost = max_cost
+        self.ladder = list(ladder)
+        self.task_tiers = task_tiers
+        self.cooldown = cooldown
+        self.prices = prices
+        self.down_until = {}
+        self.routed = {}
+        self.fallbacks = 0
+        self.lock = threading.Lock()
+
+    def _estimated_cost(self, model, prompt_tokens):
+        price = self.prices.get(model)
+        if price is None:
+            return 0.0
+        return (prompt_tokens * price[0] + EXPECTED_OUTPUT_TOKENS * price[1]) / 1_000_000
+
+    def chain(self, task, prompt_tokens=0, include_down=False):
+        top = len(self.ladder) - 1
+        tier = min(top, max(0, self.task_tiers.get(task, 1) + TARGET_SHIFT[self.target]))
+        if prompt_tokens > LONG_PROMPT_TOKENS:
+            tier = max(tier, min(1, top))
+        order = [tier] + list(range(tier - 1, -1, -1)) + ([tier + 1] if tier < top else [])
+        models = [self.ladder[i] for i in order
+                  if prompt_tokens <= CONTEXT_WINDOW.get(self.ladder[i], float("inf"))]
+        if prompt_tokens > LONG_PROMPT_TOKENS and len(models) > 1:
+            models = [m for m in models if m != self.ladder[0]] or models
+        if self.max_cost is not None and models:
+            affordable = [m for m in models if self._estimated_cost(m, prompt_tokens) <= self.max_cost]
+            models = affordable or [min(models, key=lambda m: self._estimated_cost(m, prompt_tokens))]
+        if include_down:
+            return models
+        now = time.monotonic()
+        with self.lock:
+            up = [m for m in models if self.down_until.get(m, 0) <= now]
+        # لو كلهم واقعين بنجرب السلسلة كاملة بدل ما نفشل من غير طلب
+        return up or models
+
+    def record(self, model):
+        with self.lock:
+            self.routed[model] = self.routed.get(model, 0) + 1
+
+    def mark_unavailable(self, model, error):
+        with self.lock:
+            self.fallbacks += 1
+            self.down_until[model] = time.monotonic() + (error.retry_after or self.cooldown)
+
+    def metrics(self):
+        with self.lock:
+            now = time.monotonic()
+            return {"routed": dict(self.routed), "model_fallbacks": self.fallbacks,
+                    "models_down": sorted(m for m, until in self.down_until.items() if until > now)}
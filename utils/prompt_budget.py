@@ -0,0 +1,117 @@
+import re
+
+# كلمة أو علامة ترقيم؛ الكلمات الطويلة بتتقسم لأكتر من توكن
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+# فقرات "boilerplate" في إعلانات الوظايف اللي مش بتأثر على المطابقة
+_BOILERPLATE = re.compile(
+    r"equal opportunit|equal employment|eeo\b|affirmative action|without regard to|"
+    r"about (us|the company)|who we are|our (mission|culture|values)|benefits|perks|we offer|"
+    r"privacy (policy|notice)|reasonable accommodation|background check|apply (now|today)|"
+    r"follow us|all rights reserved|salary range|compensation", re.IGNORECASE)
+
+# البرومبت نفسه (العناوين والتعليمات الثابتة) من غير المدخلات
+PROMPT_OVERHEAD_TOKENS = 400
+
+
+def estimate_tokens(text):
+    """Fast local estimate close to Gemini's tokenizer for English/Arabic text."""
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text or ""):
+        if piece.isascii():
+            tokens += 1 + (len(piece) - 1) // 5
+        else:
+            # الحروف غير اللاتينية بتاخد توكنز أكتر
+            tokens += 1 + len(piece) // 3
+    return tokens
+
+
+_TRUNCATION_MARK = "\n[...truncated to fit the input budget...]"
+
+
+def truncate_to_tokens(text, max_tokens):
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    max_tokens -= estimate_tokens(_TRUNCATION_MARK)
+    if max_tokens <= 0:
+        return ""
+    cut = int(len(text) * max_tokens / total)
+    while cut > 0 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.95)
+    # نقطع عند آخر سطر كامل لو ينفع
+    newline = text.rfind("\n", 0, cut)
+    if newline > cut * 0.8:
+        cut = newline
+    return text[:cut].rstrip() + _TRUNCATION_MARK
+
+
+def strip_boilerplate(text):
+    # بنشيل الفقرات اللي كلها كلام عام (مزايا، EEO، عن الشركة...)
+    paragraphs = re.split(r"\n\s*\n", text or "")
+    kept = [p for p in paragraphs if not _BOILERPLATE.search(p)]
+    return "\n\n".join(kept) if kept else text
+
+
+def _describe(name, before, after, how):
+    return f"{name}: {before:,} → {after:,} tokens ({how})"
+
+
+def fit_inputs(cv_content, instruction_text, job_descs, max_tokens, overhead=PROMPT_OVERHEAD_TOKENS):
+    """Trim inputs so CV + instructions + any one job description fits max_tokens.
+
+    Lowest priority goes first: extra instructions, then job-description
+    boilerplate, then the job descriptions themselves, then the CV.
+    CV and instructions are trimmed the same way for every job so the
+    shared prompt prefix stays identical. Returns
+    (cv_content, instruction_text, job_descs, report_lines).
+    """
+    report = []
+    job_descs = list(job_descs)
+    cv_tokens = estimate_tokens(cv_content)
+    instr_tokens = estimate_tokens(instruction_text)
+    jd_tokens = [estimate_tokens(jd) if jd else 0 for jd in job_descs]
+
+    def over():
+        return overhead + cv_tokens + instr_tokens + max(jd_tokens, default=0) - max_tokens
+
+    if over() <= 0:
+        return cv_content, instruction_text, job_descs, report
+
+    # 1. التعليمات الإضافية
+    if instruction_text:
+        allowed = max(0, instr_tokens - over())
+        new_text = truncate_to_tokens(instruction_text, allowed)
+        new_tokens = estimate_tokens(new_text)
+        report.append(_describe("Instructions", instr_tokens, new_tokens, "dropped" if not new_text else "truncated"))
+        instruction_text, instr_tokens = new_text, new_tokens
+
+    # 2. boilerplate الوظايف
+    if over() > 0:
+        for i, jd in enumerate(job_descs):
+            if not jd or overhead + cv_tokens + instr_tokens + jd_tokens[i] <= max_tokens:
+                continue
+            new_jd = strip_boilerplate(jd)
+            new_tokens = estimate_tokens(new_jd)
+            if new_tokens < jd_tokens[i]:
+                report.append(_describe(f"Job {i + 1}", jd_tokens[i], new_tokens, "boilerplate removed"))
+                job_descs[i], jd_tokens[i] = new_jd, new_tokens
+
+    # 3. قص وصف الوظيفة نفسه (بس مش أقل من ربع الميزانية)
+    if over() > 0:
+        jd_allowed = max(max_tokens // 4, max_tokens - overhead - cv_tokens - instr_tokens)
+        for i, jd in enumerate(job_descs):
+            if jd and jd_tokens[i] > jd_allowed:
+                new_jd = truncate_to_tokens(jd, jd_allowed)
+                new_tokens = estimate_tokens(new_jd)
+                report.append(_describe(f"Job {i + 1}", jd_tokens[i], new_tokens, "truncated"))
+                job_descs[i], jd_tokens[i] = new_jd, new_tokens
+
+    # 4. الـ CV آخر حاجة
+    if over() > 0:
+        allowed = max(0, cv_tokens - over())
+        new_cv = truncate_to_tokens(cv_content, allowed)
+        new_tokens = estimate_tokens(new_cv)
+        report.append(_describe("CV", cv_tokens, new_tokens, "truncated"))
+        cv_content, cv_tokens = new_cv, new_tokens
+
+    return cv_content, instruction_text, job_descs, report
@@ -0,0 +1,216 @@
+import re
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from utils.llm_providers import GeminiError
+
+# أخطاء مؤقتة تستاهل نعيد المحاولة
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    # Retry-After ممكن يبقى عدد ثواني أو تاريخ HTTP
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_retry_delay(body):
+    # Gemini بيحط "retryDelay": "30s" جوه تفاصيل خطأ 429
+    match = re.search(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"', body or "")
+    return float(match.group(1)) if match else None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that honours server hints."""
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, retry_statuses=RETRY_STATUSES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+
+    def should_retry(self, error, attempt):
+        if attempt >= self.max_attempts:
+            return False
+        # status_code = None يعني timeout أو مشكلة اتصال
+        return error.status_code is None or error.status_code in self.retry_statuses
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """Blocking token bucket refilled at rate_per_minute."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, rate_per_minute // 6))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, deadline_at=None):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if deadline_at is not None and time.monotonic() + wait >= deadline_at:
+                raise GeminiError("Deadline exceeded while waiting for the rate limit.", timed_out=True)
+            time.sleep(wait)
+
+
+class ModelRateLimiter:
+    """One token bucket per model; models without a limit are not throttled."""
+
+    def __init__(self, rpm_by_model=None):
+        self.buckets = {model: TokenBucket(rpm) for model, rpm in (rpm_by_model or {}).items() if rpm}
+
+    def set_limit(self, model, rpm):
+        self.buckets[model] = TokenBucket(rpm)
+
+    def acquire(self, model, deadline_at=None):
+        bucket = self.buckets.get(model)
+        if bucket:
+            bucket.acquire(deadline_at)
+
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight requests, dispatched by priority.
+
+    Healthy responses (latency within tolerance of the running average,
+    low error rate) add roughly one slot per limit's worth of calls;
+    429/503s and timeouts halve the limit, at most once per cooldown.
+
+    Free slots go to waiting interactive calls first; while both classes
+    are waiting, batch calls still get at least batch_share of the slots.
+    Within a class, waiters are served in arrival order. A waiter whose
+    deadline passes leaves the queue with a timed-out GeminiError; a slot
+    whose request was never sent goes back through cancel(), which leaves
+    the limit alone.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, decrease_factor=0.5,
+                 latency_tolerance=2.0, max_error_rate=0.1, cooldown=2.0, batch_share=0.2):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.avg_latency = None
+        self.error_rate = 0.0
+        self.last_decrease = 0.0
+        self.batch_share = batch_share
+        self.waiting = {p: deque() for p in PRIORITIES}
+        # الـ slots اللي اتوزعت والطابورين مليانين (بيتصفروا لما الزحمة تخلص)
+        self.contended = {p: 0 for p in PRIORITIES}
+        self.wait_stats = {p: {"granted": 0, "total_wait": 0.0, "max_wait": 0.0} for p in PRIORITIES}
+        self.cond = threading.Condition()
+
+    def _next_class(self):
+        if not self.waiting[INTERACTIVE]:
+            return BATCH
+        if not self.waiting[BATCH]:
+            return INTERACTIVE
+        total = sum(self.contended.values())
+        return BATCH if self.contended[BATCH] < self.batch_share * total else INTERACTIVE
+
+    def acquire(self, priority=INTERACTIVE, deadline_at=None):
+        queue = self.waiting[priority]
+        ticket = object()
+        started = time.monotonic()
+        with self.cond:
+            queue.append(ticket)
+            while not (self.in_flight < int(self.limit) and queue[0] is ticket and self._next_class() == priority):
+                if deadline_at is None:
+                    self.cond.wait()
+                    continue
+                left = deadline_at - time.monotonic()
+                if left <= 0:
+                    queue.remove(ticket)
+                    # اللي وراه ممكن يبقى دوره دلوقتي
+                    self.cond.notify_all()
+                    raise GeminiError("Deadline exceeded while waiting for a free slot.", timed_out=True)
+                self.cond.wait(left)
+            if self.waiting[INTERACTIVE] and self.waiting[BATCH]:
+                self.contended[priority] += 1
+            else:
+                self.contended = {p: 0 for p in PRIORITIES}
+            queue.popleft()
+            self.in_flight += 1
+            waited = time.monotonic() - started
+            stats = self.wait_stats[priority]
+            stats["granted"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+            # ممكن يكون فيه slot تاني فاضي للي بعده
+            self.cond.notify_all()
+
+    def cancel(self):
+        # الطلب ما اتبعتش (الـ deadline خلص محلياً): الـ slot يرجع من غير ما يأثر على الـ limit
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def release(self, latency, ok=True, overloaded=False):
+        with self.cond:
+            self.in_flight -= 1
+            self.error_rate = 0.9 * self.error_rate + 0.1 * (0.0 if ok else 1.0)
+            now = time.monotonic()
+            if overloaded:
+                if now - self.last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self.last_decrease = now
+            elif ok:
+                healthy = self.avg_latency is None or latency <= self.avg_latency * self.latency_tolerance
+                if healthy and self.error_rate <= self.max_error_rate:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+            self.cond.notify_all()
+
+    def metrics(self):
+        with self.cond:
+            return {
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "error_rate": round(self.error_rate, 3),
+                "avg_latency": round(self.avg_latency, 3) if self.avg_latency is not None else None,
+                "queues": {
+                    p: {
+                        "depth": len(self.waiting[p]),
+                        "granted": self.wait_stats[p]["granted"],
+                        "avg_wait": round(self.wait_stats[p]["total_wait"] / self.wait_stats[p]["granted"], 3)
+                        if self.wait_stats[p]["granted"] else None,
+                        "max_wait": round(self.wait_stats[p]["max_wait"], 3),
+                    }
+                    for p in PRIORITIES
+                },
+            }
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "gemini_responses.sqlite")
+
+
+def normalize_prompt(prompt):
+    # نفس البرومبت بمسافات أو نهايات سطور مختلفة = نفس المفتاح
+    lines = prompt.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+class StaleResponse(str):
+    """Cached answer served because Gemini is unavailable."""
+
+    stale = True
+
+    def __new__(cls, text, cached_at):
+        obj = super().__new__(cls, text)
+        obj.cached_at = cached_at
+        return obj
+
+
+class ResponseCache:
+    """On-disk Gemini response cache (SQLite, safe across processes).
+
+    Entries are keyed by a hash of model, generation config and the
+    normalized prompt. Least recently used entries are evicted once the
+    stored text exceeds max_bytes; ttl (seconds) expires old entries.
+    Expired entries are kept keep_stale more seconds so get_stale() can
+    still answer while the API is down.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=50 * 1024 * 1024, ttl=None, keep_stale=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.keep_stale = keep_stale
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            # WAL: كذا process يقرا ويكتب في نفس الوقت
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+
+    def _connect(self):
+        # اتصال جديد لكل عملية عشان نبقى آمنين مع الـ threads والـ processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return _closing(conn)
+
+    @staticmethod
+    def make_key(model, generation_config, prompt):
+        raw = json.dumps({
+            "model": model,
+            "config": generation_config or {},
+            "prompt": normalize_prompt(prompt),
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT text, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            text, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                if now - created_at > self.ttl + self.keep_stale:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return text
+
+    def get_stale(self, key):
+        # آخر رد متخزن حتى لو الـ TTL بتاعه خلص
+        with self._connect() as conn:
+            row = conn.execute("SELECT text, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return StaleResponse(row[0], row[1]) if row else None
+
+    def put(self, key, text):
+        now = time.time()
+        size = len(text.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, text, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, text, size, now, now),
+            )
+            if self.ttl is not None:
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl - self.keep_stale,))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+class _closing:
+    # sqlite3 "with conn" بيعمل commit بس مش بيقفل الاتصال
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
@@ -0,0 +1,80 @@
+import threading
+from utils.llm_providers import GeminiError
+
+# دولار لكل مليون توكن: (input, output, cached input)
+PRICES_PER_MILLION = {
+    "gemini-1.5-flash": (0.075, 0.30, 0.01875),
+    "gemini-1.5-flash-8b": (0.0375, 0.15, 0.01),
+    "gemini-1.5-pro": (1.25, 5.00, 0.3125),
+    "gemini-2.0-flash": (0.10, 0.40, 0.025),
+}
+
+
+class BudgetExceededError(GeminiError):
+    pass
+
+
+def _empty():
+    return {"requests": 0, "prompt_tokens": 0, "candidate_tokens": 0, "cached_tokens": 0,
+            "total_tokens": 0, "cost": 0.0}
+
+
+class UsageMeter:
+    """Add up usageMetadata per session and per batch, and enforce budgets.
+
+    max_tokens / max_cost apply to the whole session; once either is
+    reached check() refuses new requests (calls already in flight finish).
+    """
+
+    def __init__(self, max_tokens=None, max_cost=None, prices=PRICES_PER_MILLION):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.prices = prices
+        self.session = _empty()
+        self.batch = _empty()
+        self.batch_label = None
+        self.lock = threading.Lock()
+
+    def _cost(self, model, prompt, candidates, cached):
+        price = self.prices.get(model)
+        if price is None:
+            return 0.0
+        return ((prompt - cached) * price[0] + candidates * price[1] + cached * price[2]) / 1_000_000
+
+    def record(self, usage, model):
+        if not usage:
+            return
+        prompt = usage.get("promptTokenCount", 0)
+        candidates = usage.get("candidatesTokenCount", 0)
+        cached = usage.get("cachedContentTokenCount", 0)
+        total = usage.get("totalTokenCount", prompt + candidates)
+        cost = self._cost(model, prompt, candidates, cached)
+        with self.lock:
+            for totals in (self.session, self.batch):
+                totals["requests"] += 1
+                totals["prompt_tokens"] += prompt
+                totals["candidate_tokens"] += candidates
+                totals["cached_tokens"] += cached
+                totals["total_tokens"] += total
+                totals["cost"] += cost
+
+    def check(self):
+        with self.lock:
+            if self.max_tokens is not None and self.session["total_tokens"] >= self.max_tokens:
+                raise BudgetExceededError(f"Token budget exceeded ({self.session['total_tokens']}/{self.max_tokens}).")
+            if self.max_cost is not None and self.session["cost"] >= self.max_cost:
+                raise BudgetExceededError(f"Cost budget exceeded (${self.session['cost']:.4f}/${self.max_cost:.2f}).")
+
+    def start_batch(self, label=None):
+        with self.lock:
+            self.batch = _empty()
+            self.batch_label = label
+
+    def totals(self):
+        with self.lock:
+            return {"session": dict(self.session), "batch": dict(self.batch)}
+
+
+def format_usage(totals):
+    return (f"{totals['requests']} call(s), {totals['prompt_tokens']:,} prompt + {totals['candidate_tokens']:,} output tokens"
+            f" ({totals['cached_tokens']:,} cached), ≈ ${totals['cost']:.4f}")
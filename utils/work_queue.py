@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from utils.response_cache import _closing
+
+DEFAULT_QUEUE_PATH = os.path.join(".cache", "gemini_work_queue.sqlite")
+
+PENDING = "pending"
+DONE = "done"
+
+
+def run_id_for(mode, prefix, prompts, generation_config=None, task=None):
+    # نفس الدفعة بنفس المدخلات = نفس الـ run، فتشغيلها تاني بيكمل من مكان ما وقفت
+    raw = json.dumps({"mode": mode, "prefix": prefix, "prompts": prompts,
+                      "config": generation_config or {}, "task": task}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class WorkQueue:
+    """Durable queue of batch prompts and their results (SQLite, WAL).
+
+    A run stores everything needed to resume it (prompts, shared prefix,
+    generation config, labels). Each result is committed as soon as it
+    arrives, so after a crash only the prompts still pending are sent
+    again. Failed answers stay pending. Finished runs are kept keep_days
+    and then pruned.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, keep_days=30):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    label TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    prefix TEXT,
+                    generation_config TEXT,
+                    task TEXT,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    run_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    label TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, idx)
+                )
+            """)
+            old = time.time() - keep_days * 24 * 3600
+            conn.execute("DELETE FROM items WHERE run_id IN "
+                         "(SELECT run_id FROM runs WHERE finished_at IS NOT NULL AND finished_at < ?)", (old,))
+            conn.execute("DELETE FROM runs WHERE finished_at IS NOT NULL AND finished_at < ?", (old,))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        # كل نتيجة لازم توصل للديسك قبل ما نكمل
+        conn.execute("PRAGMA synchronous=FULL")
+        return _closing(conn)
+
+    def open_run(self, mode, prefix, prompts, labels, generation_config=None, task=None):
+        """Create the run (or find it again if it never finished) and return its id."""
+        run_id = run_id_for(mode, prefix, prompts, generation_config, task)
+        now = time.time()
+        with self._connect() as conn:
+            # run خلصت قبل كده ما بتترجعش: نتايجها ممكن تكون قديمة (TTL / GEMINI_CACHE=0)، فبنبدأ من الأول
+            finished = conn.execute("SELECT finished_at FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if finished and finished[0] is not None:
+                conn.execute("DELETE FROM items WHERE run_id = ?", (run_id,))
+                conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, label, mode, prefix, generation_config, task, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, ", ".join(labels)[:200], mode, prefix,
+                 json.dumps(generation_config) if generation_config else None, task, now),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (run_id, idx, label, prompt, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, idx, label, prompt, PENDING, now) for idx, (label, prompt) in enumerate(zip(labels, prompts))],
+            )
+        return run_id
+
+    def load_run(self, run_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT label, mode, prefix, generation_config, task FROM runs WHERE run_id = ?",
+                               (run_id,)).fetchone()
+            if row is None:
+                return None
+            items = conn.execute("SELECT idx, label, prompt, status, result FROM items WHERE run_id = ? ORDER BY idx",
+                                 (run_id,)).fetchall()
+        label, mode, prefix, config, task = row
+        return {
+            "run_id": run_id,
+            "label": label,
+            "mode": mode,
+            "prefix": prefix,
+            "generation_config": json.loads(config) if config else None,
+            "task": task,
+            "labels": [item[1] for item in items],
+            "prompts": [item[2] for item in items],
+            "results": [item[4] if item[3] == DONE else None for item in items],
+        }
+
+    def complete(self, run_id, idx, result):
+        with self._connect() as conn:
+            conn.execute("UPDATE items SET status = ?, result = ?, updated_at = ? WHERE run_id = ? AND idx = ?",
+                         (DONE, result, time.time(), run_id, idx))
+
+    def finish(self, run_id):
+        """Mark the run finished if no item is still pending; returns whether it was."""
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ? AND NOT EXISTS "
+                                  "(SELECT 1 FROM items WHERE run_id = ? AND status = ?)",
+                                  (time.time(), run_id, run_id, PENDING))
+            return cursor.rowcount > 0
+
+    def discard(self, run_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM items WHERE run_id = ?", (run_id,))
+            conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    def unfinished(self):
+        """[(run_id, label, done, total)] for runs that never finished, newest first."""
+        with self._connect() as conn:
+            return conn.execute("""
+                SELECT r.run_id, r.label, SUM(i.status = ?), COUNT(i.idx)
+                FROM runs r JOIN items i ON i.run_id = r.run_id
+                WHERE r.finished_at IS NULL
+                GROUP BY r.run_id ORDER BY r.created_at DESC
+            """, (DONE,)).fetchall()